@@ -4,6 +4,16 @@ defmodule Gameboy.PyWorker do
   use Export.Python
   require Logger
 
+  # canoe_ai calls arriving within @canoe_batch_wait_ms of each other (up to
+  # @canoe_batch_size of them) are answered with a single batched Python call.
+  @canoe_batch_size 16
+  @canoe_batch_wait_ms 5
+  # Time a canoe_ai call has, from when the caller makes it, before positions the
+  # network hasn't answered get a fallback move. Time spent in this process's mailbox
+  # (behind an earlier batch's Python call) and waiting for the batch comes out of it.
+  # Well inside the 15 s call timeout below.
+  @canoe_deadline_ms 10_000
+
   # optional, omit if adding this to a supervision tree
   def start_link(_) do
     GenServer.start_link(__MODULE__, %{}, name: __MODULE__)
@@ -11,18 +21,53 @@ defmodule Gameboy.PyWorker do
   
   def canoe_ai(reds, blues, ai_team) do
     Logger.debug("Calling canoe_ai (#{__MODULE__})")
-    GenServer.call(__MODULE__, {:canoe_ai, {reds, blues, ai_team}}, 15000)
+    sent_at = System.monotonic_time(:millisecond)
+    GenServer.call(__MODULE__, {:canoe_ai, {reds, blues, ai_team}, sent_at}, 15000)
   end
   
   def init_canoe_ai() do
-    GenServer.call(__MODULE__, {:init_canoe_ai}, 15000)
+    GenServer.call(__MODULE__, {:init_canoe_ai}, 60000)
+  end
+
+  # Loads and warms up another model in the background; bot moves keep using the
+  # current model until it is ready. E.g. swap_canoe_model("ac", 13). Replies with the
+  # swap's status ("loading"); canoe_model_info/0 reports whether it finished ("done")
+  # or failed ("failed", with the error).
+  def swap_canoe_model(name, version) do
+    GenServer.call(__MODULE__, {:swap_canoe_model, [name, version]})
+  end
+
+  def swap_canoe_model(name) do
+    GenServer.call(__MODULE__, {:swap_canoe_model, [name]})
+  end
+
+  # Per-phase latency histograms of the Python side (see canoe_ai.stats/0); timing is
+  # off until enable_canoe_stats/0 or with CANOEBOT_STATS set in the environment.
+  def canoe_stats() do
+    GenServer.call(__MODULE__, {:canoe_python, "stats"})
+  end
+
+  # The model served, the models loaded and the status of the last model swap.
+  def canoe_model_info() do
+    GenServer.call(__MODULE__, {:canoe_python, "model_info"})
+  end
+
+  def reset_canoe_stats() do
+    GenServer.call(__MODULE__, {:canoe_python, "reset_stats"})
+  end
+
+  def enable_canoe_stats() do
+    GenServer.call(__MODULE__, {:canoe_python, "enable_stats"})
   end
 
   # server
   def init(state) do
     priv_path = Path.join(:code.priv_dir(:gameboy), "python")
     {:ok, py} = Python.start_link(python_path: priv_path)
-    state = Map.put(state, :py, py)
+    state =
+      state
+      |> Map.put(:py, py)
+      |> Map.put(:pending_canoe_ai, [])
     Logger.debug("Initialized Python.}")
     {:ok, state}
   end
@@ -32,11 +77,54 @@ defmodule Gameboy.PyWorker do
     {:reply, raw, state}
   end
 
-  def handle_call({:canoe_ai, {reds, blues, ai_team}}, _from, %{py: py} = state) do
-    raw = Python.call(py, "canoe_ai", "canoe_ai", [reds, blues, ai_team])
+  def handle_call({:canoe_python, function}, _from, %{py: py} = state) do
+    raw = Python.call(py, "canoe_ai", function, [])
+    {:reply, raw, state}
+  end
+
+  def handle_call({:swap_canoe_model, args}, _from, %{py: py} = state) do
+    raw = Python.call(py, "canoe_ai", "swap_model_async", args)
     {:reply, raw, state}
   end
 
+  def handle_call({:canoe_ai, request, sent_at}, from, %{pending_canoe_ai: pending} = state) do
+    pending = [{from, request, sent_at} | pending]
+    state = %{state | pending_canoe_ai: pending}
+
+    cond do
+      length(pending) >= @canoe_batch_size ->
+        {:noreply, flush_canoe_ai(state)}
+
+      length(pending) == 1 ->
+        Process.send_after(self(), :flush_canoe_ai, @canoe_batch_wait_ms)
+        {:noreply, state}
+
+      true ->
+        {:noreply, state}
+    end
+  end
+
+  def handle_info(:flush_canoe_ai, state) do
+    {:noreply, flush_canoe_ai(state)}
+  end
+
+  defp flush_canoe_ai(%{pending_canoe_ai: []} = state), do: state
+
+  defp flush_canoe_ai(%{py: py, pending_canoe_ai: pending} = state) do
+    pending = Enum.reverse(pending)
+    requests = Enum.map(pending, fn {_from, request, _sent_at} -> request end)
+    # The batch shares one deadline, the one of its oldest request.
+    oldest = pending |> Enum.map(fn {_from, _request, sent_at} -> sent_at end) |> Enum.min()
+    remaining_ms = max(@canoe_deadline_ms - (System.monotonic_time(:millisecond) - oldest), 0)
+    moves = Python.call(py, "canoe_ai", "canoe_ai_batch", [requests, remaining_ms])
+
+    # Each move comes back as {x, y, tier}; callers get {x, y}.
+    Enum.zip(pending, moves)
+    |> Enum.each(fn {{from, _request, _sent_at}, {x, y, _tier}} -> GenServer.reply(from, {x, y}) end)
+
+    %{state | pending_canoe_ai: []}
+  end
+
   def terminate(_reason, %{py: py} = _state) do
     Python.stop(py)
     :ok
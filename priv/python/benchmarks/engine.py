@@ -0,0 +1,236 @@
+"""Throughput benchmarks for the canoebot engine, encoders and agents.
+
+Positions come from seeded random games at three stages (opening, middlegame,
+endgame); network agents use stub models with fixed weights, so no trained model
+or TensorFlow is needed:
+
+    cd priv/python && python benchmarks/engine.py --json > before.json
+    ... change something ...
+    python benchmarks/engine.py --compare before.json [--threshold 0.1]
+
+--compare exits with status 1 when any benchmark is slower than the baseline by
+more than the threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from canoebot import agent, encoders  # noqa: E402
+from canoebot.board import POINTS, GameState, Player  # noqa: E402
+
+SEED = 20240601
+STAGES = {'opening': 2, 'middlegame': 20, 'endgame': 40}
+POSITIONS_PER_STAGE = 16
+
+
+def positions(stage):
+    # POSITIONS_PER_STAGE unfinished positions after STAGES[stage] random moves.
+    rng = np.random.RandomState(SEED + STAGES[stage])
+    found = []
+    while len(found) < POSITIONS_PER_STAGE:
+        game = GameState.new_game()
+        for _ in range(STAGES[stage]):
+            moves = game.legal_moves()
+            game.push(moves[rng.randint(len(moves))])
+            if game.is_over():
+                break
+        if not game.is_over():
+            found.append(game)
+    return found
+
+
+class StubPolicyModel():
+    # Fixed-weight linear policy/value over the flattened board tensor, standing in for
+    # the Keras models: predict() gives the policy, __call__ gives (policy, value).
+    def __init__(self, input_size, num_points=78):
+        rng = np.random.RandomState(SEED)
+        self.weights = rng.normal(scale=0.1, size=(input_size, num_points)).astype(np.float32)
+        self.value_weights = rng.normal(scale=0.1, size=(input_size, 1)).astype(np.float32)
+
+    def _policy(self, X):
+        X = np.asarray(X, dtype=np.float32).reshape(len(X), -1)
+        logits = X @ self.weights
+        e = np.exp(logits - logits.max(axis=1, keepdims=True))
+        return X, e / e.sum(axis=1, keepdims=True)
+
+    def predict(self, X, **kwargs):
+        return self._policy(X)[1]
+
+    def __call__(self, X):
+        X, policy = self._policy(X)
+        return policy, np.tanh(X @ self.value_weights)
+
+
+class StubQModel():
+    def __init__(self, input_size, num_points=78):
+        rng = np.random.RandomState(SEED)
+        self.board_weights = rng.normal(scale=0.1, size=(input_size,)).astype(np.float32)
+        self.move_weights = rng.normal(scale=0.1, size=(num_points,)).astype(np.float32)
+        self.inputs = ('board', 'move')
+
+    def predict(self, inputs, **kwargs):
+        boards, moves = inputs
+        boards = np.asarray(boards, dtype=np.float32).reshape(len(boards), -1)
+        return np.tanh(boards @ self.board_weights + np.asarray(moves) @ self.move_weights)[:, None]
+
+
+def make_agents():
+    encoder = encoders.RelativeEncoder(dtype=np.float32)
+    size = int(np.prod(encoder.shape()))
+    ac = agent.ACAgent(StubPolicyModel(size), encoder)
+    return {
+        'RandomAgent': agent.RandomAgent(),
+        'NeighborAgent': agent.NeighborAgent(),
+        'GreedyAgent': agent.GreedyAgent(),
+        'SearchAgent': agent.SearchAgent(),
+        'DeepLearningAgent': agent.DeepLearningAgent(StubPolicyModel(size), encoder),
+        'PolicyAgent': agent.PolicyAgent(StubPolicyModel(size), encoder),
+        'QAgent': agent.QAgent(StubQModel(size), encoder),
+        'ACAgent': ac,
+        'MCTSAgent': agent.MCTSAgent(ac, num_simulations=32, batch_size=8),
+    }
+
+
+def play_game(red, yellow):
+    game = GameState.new_game()
+    while not game.is_over():
+        game.push((red if game.current_player == Player.red else yellow).select_move(game))
+    return game
+
+
+def benchmarks():
+    # Returns ({name: function of one position}, agents); each runs on every stage.
+    agents = make_agents()
+    cases = {}
+
+    def board_place_peg(game):
+        board = game.board.copy()
+        board.place_peg(game.current_player, POINTS[game.board.open_indices()[0]])
+    cases['board.place_peg'] = board_place_peg
+    cases['board.get'] = lambda game: [ game.board.get(POINTS[idx]) for idx in (14, 30, 45, 60) ]
+    cases['board.return_open_spaces'] = lambda game: game.board.return_open_spaces()
+    cases['board.is_on_grid'] = lambda game: [ game.board.is_on_grid(POINTS[idx]) for idx in (0, 14, 52, 60) ]
+    cases['game.apply_move'] = lambda game: game.apply_move(game.legal_moves()[0])
+
+    def push_pop(game):
+        game.push(game.legal_moves()[0])
+        game.pop()
+    cases['game.push_pop'] = push_pop
+    cases['game.completes_canoe'] = lambda game: [
+        game.completes_canoe(POINTS[idx], player) for idx in game.board.open_indices()[:8] for player in Player ]
+    cases['game.apply_move_is_over'] = lambda game: game.apply_move(game.legal_moves()[-1]).is_over()
+    for name in ('oneplane', 'sixplane', 'relative'):
+        encoder = encoders.get_encoder_by_name(name)
+        cases[f'encode.{name}'] = encoder.encode
+    for name, player in agents.items():
+        cases[f'select_move.{name}'] = player.select_move
+    return cases, agents
+
+
+def time_per_op(fn, inputs, min_time):
+    # Best of 3 runs of mean seconds per call, each run at least min_time long.
+    best = None
+    for _ in range(3):
+        calls = 0
+        start = time.perf_counter()
+        while True:
+            for x in inputs:
+                fn(x)
+            calls += len(inputs)
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                break
+        per_op = elapsed / calls
+        best = per_op if best is None else min(best, per_op)
+    return best
+
+
+def run(only=None, min_time=0.2):
+    np.random.seed(SEED)
+    cases, agents = benchmarks()
+    stage_positions = { stage: positions(stage) for stage in STAGES }
+    results = {}
+    for name, fn in cases.items():
+        for stage in STAGES:
+            key = f'{name}[{stage}]'
+            if only and only not in key:
+                continue
+            # Reseed per benchmark so its random choices don't depend on which ran before.
+            np.random.seed(SEED)
+            results[key] = {'us_per_op': 1e6 * time_per_op(fn, stage_positions[stage], min_time)}
+
+    key = 'games.RandomAgent_vs_GreedyAgent'
+    if not only or only in key:
+        np.random.seed(SEED)
+        games = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < 5 * min_time or games < 4:
+            play_game(agents['RandomAgent'], agents['GreedyAgent'])
+            games += 1
+        elapsed = time.perf_counter() - start
+        results[key] = {'us_per_op': 1e6 * elapsed / games, 'games_per_sec': games / elapsed}
+
+    batch = stage_positions['middlegame']
+    key = f'encode_batch.relative[{len(batch)}]'
+    if not only or only in key:
+        encoder = encoders.RelativeEncoder(dtype=np.float32)
+        results[key] = {'us_per_op': 1e6 * time_per_op(lambda games: encoder.encode_batch(games), [batch], min_time)}
+    return results
+
+
+def compare(results, baseline, threshold):
+    # Prints one line per benchmark in both runs; returns the names that regressed.
+    regressions = []
+    for key in sorted(set(results) & set(baseline)):
+        old, new = baseline[key]['us_per_op'], results[key]['us_per_op']
+        ratio = new / old if old else float('inf')
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = 'REGRESSION'
+            regressions.append(key)
+        elif ratio < 1 - threshold:
+            flag = 'faster'
+        print(f'{key:48s} {old:12.2f} {new:12.2f} us  x{ratio:5.2f}  {flag}')
+    for key in sorted(set(baseline) - set(results)):
+        print(f'{key:48s} missing from this run')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--only', help='run only benchmarks whose name contains this')
+    parser.add_argument('--min-time', type=float, default=0.2, help='seconds per timing run')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    parser.add_argument('--compare', metavar='BASELINE', help='JSON from an earlier --json run')
+    parser.add_argument('--threshold', type=float, default=0.1, help='relative slowdown counted as a regression')
+    args = parser.parse_args()
+
+    results = run(args.only, args.min_time)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        if args.only:
+            baseline = { key: value for key, value in baseline.items() if args.only in key }
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f'{len(regressions)} regression(s) beyond {100 * args.threshold:.0f}%')
+            sys.exit(1)
+        return
+    if args.json:
+        meta = {'python': platform.python_version(), 'numpy': np.__version__,
+                'machine': platform.machine(), 'seed': SEED}
+        print(json.dumps({'meta': meta, 'results': results}, indent=2))
+        return
+    for key, result in results.items():
+        print(f'{key:48s} {result["us_per_op"]:12.2f} us')
+
+
+if __name__ == '__main__':
+    main()
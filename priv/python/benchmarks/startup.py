@@ -0,0 +1,76 @@
+"""Cold-start timings for the canoe bot's Python worker.
+
+Each stage runs in a fresh interpreter, the way Gameboy.PyWorker starts one:
+
+    cd priv/python && python benchmarks/startup.py [--repeat 3]
+
+Stages that need a trained model report the error instead of a time when
+generated_models/ is missing.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+PYTHON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STAGES = [
+    ('import numpy', 'import numpy'),
+    ('import canoebot.board', 'import canoebot.board'),
+    ('import canoebot', 'import canoebot'),
+    ('import canoe_ai', 'import canoe_ai'),
+    ('canoe_ai.init', 'import canoe_ai; canoe_ai.init()'),
+    ('first canoe_ai move', 'import canoe_ai; canoe_ai.canoe_ai([], [], 1)'),
+]
+
+TIMER = '''
+import time
+_start = time.perf_counter()
+{code}
+print("ELAPSED", time.perf_counter() - _start)
+'''
+
+
+def time_stage(code):
+    # Run from the repository root, like the Elixir app.
+    repo_root = os.path.dirname(os.path.dirname(PYTHON_DIR))
+    env = dict(os.environ, PYTHONPATH=PYTHON_DIR)
+    result = subprocess.run([sys.executable, '-c', TIMER.format(code=code)],
+                            cwd=repo_root, env=env, capture_output=True, text=True)
+    for line in result.stdout.splitlines():
+        if line.startswith('ELAPSED '):
+            return float(line.split()[1]), None
+    error = result.stderr.strip().splitlines()
+    return None, error[-1] if error else f'exit code {result.returncode}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    results = {}
+    for name, code in STAGES:
+        times = []
+        error = None
+        for _ in range(args.repeat):
+            elapsed, error = time_stage(code)
+            if elapsed is None:
+                break
+            times.append(elapsed)
+        results[name] = {'best_s': min(times), 'runs': times} if times else {'error': error}
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for name, result in results.items():
+        if 'error' in result:
+            print(f'{name:24s} failed: {result["error"]}')
+        else:
+            print(f'{name:24s} {1000 * result["best_s"]:9.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
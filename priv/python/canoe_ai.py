@@ -1,12 +1,72 @@
 
-import numpy as np
+import collections
+import os
+import threading
 import time
+from concurrent import futures
 import canoebot.agent as agent
+import canoebot.batching as batching
+import canoebot.book as book
+import canoebot.cache as cache
 import canoebot.encoders as encoders
-import canoebot.utils as utils
-from canoebot.board import Board, GameState, Player
+import canoebot.endgame as endgame
+import canoebot.registry as registry
+import canoebot.search as search
+import canoebot.timing as timing
+from canoebot.board import PLAY_MOVES, Board, GameState, Player
 
-agent1 = agent.ACAgent(utils.load_model("ac-v12"), encoders.RelativeEncoder())
+# Served from canoebot/generated_models/: ac-v12.h5 or its .npz export, and the optional
+# ac-v12.book.npy opening book. See canoebot/registry.py for how to generate them.
+MODEL_NAME = "ac"
+MODEL_VERSION = 12
+POSITION_CACHE_SIZE = 100000
+# At or below this many open spaces moves come from the exact endgame solver.
+ENDGAME_OPEN_SPACES = 12
+# Time allowed per call unless the caller passes deadline_ms; well inside the Elixir
+# side's 15 s GenServer.call timeout.
+DEADLINE_MS = 10000
+# Seconds of MCTS after the network answers; 0 turns the search tier off. The search
+# stops SEARCH_MARGIN seconds before the deadline.
+SEARCH_SECONDS = 0.0
+SEARCH_MARGIN = 0.05
+SEARCH_SIMULATIONS = 100000
+
+# Move selection runs these tiers in order and answers with the first that has a move,
+# except that a finished search replaces the network's move:
+#   tactical  win at once, or block the opponent's immediate win
+#   book      the opening book
+#   endgame   the exact endgame solver
+#   network   the policy network
+#   search    MCTS guided by the network, when SEARCH_SECONDS > 0
+#   fallback  the best cell by static canoe count, when the network misses the deadline
+# A tier that raises is skipped like one without a move. A position with no open cell
+# gets (None, None) and tier None.
+TIERS = ('tactical', 'book', 'endgame', 'network', 'search', 'fallback')
+
+models = registry.ModelRegistry()
+
+# Per-phase latency histograms, on when CANOEBOT_STATS is set or after enable_stats().
+# None while disabled so the hot path only pays for `is not None` checks.
+timings = timing.Timings() if os.environ.get('CANOEBOT_STATS') else None
+
+# Loaded by init() so that importing this module doesn't pull in TensorFlow. Replaced
+# as a whole by swap_model; callers read it once per request.
+agent1 = None
+model_id = None
+# The opening book built for the served model, if one exists: it answers early
+# positions from a memory-mapped table without touching the network.
+opening_book = None
+# Independent of the model, so it keeps its solved positions across swaps.
+endgame_solver = endgame.EndgameSolver(ENDGAME_OPEN_SPACES)
+_swap_lock = threading.Lock()
+# Status of the last swap_model_async call (see there), None before the first.
+last_swap = None
+# Network calls (and the search) run on this thread so a caller can stop waiting at
+# its deadline.
+_network = futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='canoebot-network')
+# The last network call that ran past its caller's deadline, while it still holds the thread.
+_overrun = None
+tier_counts = collections.Counter()
 
 
 def xy_to_idx(pt):
@@ -14,32 +74,257 @@ def xy_to_idx(pt):
     return 13*y + x
 
 
-def canoe_ai(reds, yellows, ai_team):
+def game_from_pegs(reds, yellows, ai_team):
     player = Player.red if ai_team == 1 else Player.yellow
 
     reds = [ xy_to_idx(pt) for pt in reds ]
     yellows = [ xy_to_idx(pt) for pt in yellows ]
     new_board = Board()
-    
-    new_board.reds = np.zeros(78, dtype=bool)
-    for x in reds:
-        new_board.reds[x] = True
-    new_board.yellows = np.zeros(78, dtype=bool)
-    for x in yellows:
-        new_board.yellows[x] = True
-
-    game = GameState(board = new_board, current_player=player, previous = None, move = None)
-    # game.print_board()
-    bot_move = agent1.select_move(game)
+    new_board.red_bits = sum(1 << x for x in reds)
+    new_board.yellow_bits = sum(1 << x for x in yellows)
+
+    return GameState(board = new_board, current_player=player, previous = None, move = None)
 
+
+def move_to_xy(bot_move):
     x = int(bot_move.point.col - 1)
     y = int(bot_move.point.row - 1)
-    print(f"Making a move for {player}, reds: {reds}, yellows: {yellows}: {(x, y)}")
     return (x, y)
 
+
+def canoe_ai(reds, yellows, ai_team, deadline_ms=None):
+    x, y, _ = canoe_ai_tiered(reds, yellows, ai_team, deadline_ms)
+    return (x, y)
+
+
+def canoe_ai_tiered(reds, yellows, ai_team, deadline_ms=None):
+    # canoe_ai, also returning the tier that chose the move (see TIERS). deadline_ms is
+    # the time allowed for the call, DEADLINE_MS by default.
+    (x, y, tier), = canoe_ai_batch([(reds, yellows, ai_team)], deadline_ms)
+    return (x, y, tier)
+
+
+def canoe_ai_batch(requests, deadline_ms=None):
+    # requests is a list of (reds, yellows, ai_team), one per room; returns an (x, y, tier)
+    # per request, as canoe_ai_tiered. The positions the instant tiers don't answer share
+    # one encode and one network call.
+    deadline = _deadline(deadline_ms)
+    init()
+    recorder = timings
+    start = time.perf_counter() if recorder is not None else 0
+    games = [ game_from_pegs(reds, yellows, ai_team) for reds, yellows, ai_team in requests ]
+    if recorder is not None:
+        lap = recorder.lap('decode', start)
+    answers = _select_moves(games, deadline)
+    moves = []
+    for bot_move, tier in answers:
+        if bot_move is None:
+            tier = None
+        tier_counts[tier] += 1
+        moves.append((move_to_xy(bot_move) if bot_move is not None else (None, None)) + (tier,))
+    if recorder is not None:
+        if len(answers) == 1:
+            recorder.lap(moves[0][2], lap)
+        recorder.lap('total', start)
+    print(f"Made {len(moves)} moves: {moves}")
+    return moves
+
+def _select_moves(games, deadline):
+    # A (move, tier) per game, going down TIERS.
+    answers = [ _instant_move(game, deadline) for game in games ]
+    misses = [ i for i, (bot_move, _) in enumerate(answers) if bot_move is None ]
+    if misses:
+        bot_moves = _before(deadline, batching.select_moves_batched, agent1, [ games[i] for i in misses ])
+        if bot_moves is not None:
+            for n, i in enumerate(misses):
+                answers[i] = (bot_moves[n], 'network')
+            if SEARCH_SECONDS > 0:
+                # The positions are searched one after another, sharing what is left.
+                for n, i in enumerate(misses):
+                    left = deadline - time.monotonic() - SEARCH_MARGIN
+                    budget = min(SEARCH_SECONDS, left / (len(misses) - n))
+                    if budget <= 0:
+                        break
+                    searched = _before(deadline, _search_move, agent1, games[i], budget)
+                    if searched is not None:
+                        answers[i] = (searched, 'search')
+    for i, (bot_move, _) in enumerate(answers):
+        if bot_move is None:
+            answers[i] = (_fallback_move(games[i]), 'fallback')
+    return answers
+
+def _deadline(deadline_ms):
+    return time.monotonic() + (DEADLINE_MS if deadline_ms is None else deadline_ms) / 1000
+
+def _instant_move(game, deadline):
+    # (move, tier) from the tiers that don't need the network: a win or forced block, the
+    # opening book, the endgame solver. (None, None) when none of them answers.
+    bot_move = _guarded('tactical', _tactical_move, game)
+    if bot_move is not None:
+        return bot_move, 'tactical'
+    current = opening_book
+    if current is not None:
+        bot_move = _guarded('book', current.select_move, game)
+        if bot_move is not None:
+            return bot_move, 'book'
+    bot_move = _guarded('endgame', endgame_solver.select_move, game, deadline)
+    if bot_move is not None:
+        return bot_move, 'endgame'
+    return None, None
+
+def _tactical_move(game):
+    mine, theirs, my_canoes, their_canoes = search.position_bits(game)
+    idx, _ = search.tactical_move(mine, theirs, my_canoes, their_canoes)
+    return PLAY_MOVES[idx] if idx is not None else None
+
+def _guarded(tier, fn, *args):
+    # fn(*args), or None if it raises: one failing tier shouldn't cost the move.
+    try:
+        return fn(*args)
+    except Exception as e:
+        print(f"canoe_ai: {tier} tier failed: {e!r}")
+        return None
+
+def _before(deadline, fn, *args):
+    # fn(*args) on the network thread, or None if it raised or hasn't finished by deadline.
+    # A call that overruns keeps the thread until it returns; meanwhile later calls get
+    # None at once instead of queueing behind it until their own deadline.
+    global _overrun
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        return None
+    overrun = _overrun
+    if overrun is not None and not overrun.done():
+        return None
+    future = _network.submit(fn, *args)
+    try:
+        return future.result(timeout=remaining)
+    except futures.TimeoutError:
+        if not future.cancel():
+            _overrun = future
+        return None
+    except Exception as e:
+        print(f"canoe_ai: {fn.__name__} failed: {e!r}")
+        return None
+
+def _search_move(ac_agent, game, budget):
+    # MCTS over the network's policy and value for budget seconds.
+    searcher = agent.MCTSAgent(ac_agent, num_simulations=SEARCH_SIMULATIONS, time_budget=budget)
+    return searcher.select_move(game)
+
+def _fallback_move(game):
+    # The best open cell by the static canoe count: instant, used when the network misses
+    # the deadline. None when no cell is open.
+    mine, theirs, _, _ = search.position_bits(game)
+    idx = search.best_cell(mine, theirs)
+    return PLAY_MOVES[idx] if idx is not None else None
+
+def _load_book(name, version):
+    path = models.path(name, version, extension=book.BOOK_EXTENSION)
+    return book.OpeningBook.load(path) if os.path.exists(path) else None
+
+def _load_agent(name, version):
+    # A ready-to-serve agent: model loaded, fresh position cache (cached outputs belong to
+    # one model) and one forward pass done, so its first real move doesn't pay for setup.
+    new_agent = agent.ACAgent(models.load(name, version), encoders.RelativeEncoder())
+    new_agent.set_cache(cache.PositionCache(POSITION_CACHE_SIZE))
+    new_agent.select_move(GameState.new_game())
+    new_agent.set_timings(timings)
+    return new_agent
+
 def init():
+    # Loads the model and runs one forward pass so the first real move doesn't pay for
+    # TensorFlow's startup and graph setup. Safe to call repeatedly.
+    global agent1, model_id, opening_book
+    if agent1 is None:
+        with _swap_lock:
+            if agent1 is None:
+                model_id = models.resolve(MODEL_NAME, MODEL_VERSION)
+                opening_book = _load_book(MODEL_NAME, MODEL_VERSION)
+                agent1 = _load_agent(MODEL_NAME, MODEL_VERSION)
     return None
 
+def _text(value):
+    # Elixir strings arrive through the Python bridge as bytes.
+    return value.decode() if isinstance(value, bytes) else value
+
+def swap_model(name, version=None):
+    # Loads and warms up another model while the current one keeps serving, then switches
+    # to it in one assignment and drops the old model from the registry, so its weights
+    # go once the requests still using it finish. Returns the id of the model now served.
+    global agent1, model_id, opening_book
+    name = _text(name)
+    with _swap_lock:
+        new_agent = _load_agent(name, version)
+        new_book = _load_book(name, version)
+        old_id = model_id
+        model_id, agent1, opening_book = models.resolve(name, version), new_agent, new_book
+        if old_id is not None and old_id != model_id:
+            models.evict(old_id)
+    print(f"Now serving {model_id}")
+    return model_id
+
+def swap_model_async(name, version=None):
+    # swap_model on a background thread, for callers that can't block on the load.
+    # Returns the swap's status, which model_info keeps reporting: 'loading' until the
+    # new model serves ('done') or the swap fails ('failed', with the error).
+    global last_swap
+    name = _text(name)
+    last_swap = {'name': name, 'version': version, 'status': 'loading', 'error': None}
+    thread = threading.Thread(target=_swap_in_background, args=(name, version, last_swap), name='canoebot-swap', daemon=True)
+    thread.start()
+    return last_swap
+
+def _swap_in_background(name, version, status):
+    try:
+        swap_model(name, version)
+        status['status'] = 'done'
+    except Exception as e:
+        print(f"Swapping to {name} {version} failed: {e!r}")
+        status['error'] = repr(e)
+        status['status'] = 'failed'
+
+def model_info():
+    # The model served, the models loaded, and the status of the last swap_model_async.
+    return {'model': model_id, 'loaded': [ list(key) for key in models.loaded() ], 'swap': last_swap}
+
+def enable_stats(enabled=True):
+    # Turns the phase timers on or off; turning them on starts from empty histograms.
+    global timings
+    timings = timing.Timings() if enabled else None
+    if agent1 is not None:
+        agent1.set_timings(timings)
+    return None
+
+def stats():
+    # Latency per phase (decode, encode, forward, sampling, total, and one per tier in
+    # TIERS) in milliseconds; the number of moves each tier answered; the position cache,
+    # opening book and endgame solver counters.
+    return {
+        'enabled': timings is not None,
+        'model': model_id,
+        'phases': timings.stats() if timings is not None else {},
+        'tiers': dict(tier_counts),
+        'cache': cache_stats(),
+        'book': opening_book.stats() if opening_book is not None else {},
+        'endgame': endgame_solver.stats(),
+    }
+
+def reset_stats():
+    if timings is not None:
+        timings.reset()
+    tier_counts.clear()
+    if agent1 is not None and agent1.cache is not None:
+        agent1.cache.hits = agent1.cache.misses = 0
+    if opening_book is not None:
+        opening_book.hits = opening_book.misses = 0
+    return None
+
+def cache_stats():
+    if agent1 is None or agent1.cache is None:
+        return {}
+    return agent1.cache.stats()
+
 def main():
     test()
 
@@ -1,4 +1,5 @@
 from canoebot.agent import *
+from canoebot.batching import *
 from canoebot.board import *
 from canoebot.encoders import *
 from canoebot.experience import *
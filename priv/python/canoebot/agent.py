@@ -1,8 +1,15 @@
+import time
+
 import numpy as np
-from canoebot.board import Move, Point
+from canoebot.board import Move, PLAY_MOVES
+from canoebot.geometry import NEIGHBORHOODS, NUM_POINTS, OFF_GRID, POINTS
 import canoebot.encoders as encoders
-from tensorflow.keras.optimizers import SGD
+import canoebot.mcts as mcts
+import canoebot.search as search
+import canoebot.training as training
+import canoebot.utils as utils
 
+# tensorflow is only imported by the train methods below; inference just calls the model.
 # Optional: disable GPU -- we're only using tensorflow.model.predict()
 # import os
 # os.environ["CUDA_VISIBLE_DEVICES"] = "-1"
@@ -14,6 +21,23 @@ class Agent:
   def select_move(self, game_state):
     raise NotImplementedError()
 
+  def select_moves(self, game_states):
+    # One move per position. Network agents override this to share one encode_batch and
+    # one forward pass across the whole list.
+    return [ self.select_move(game_state) for game_state in game_states ]
+
+def sample_legal_moves(move_probs, legal):
+  # Draws one point index per row of move_probs, restricted to the row's legal cells and
+  # proportional to move_probs there. This is the distribution the single-position
+  # select_move loops produce by ranking every point and taking the first valid one.
+  weights = np.where(legal, move_probs, 0.0)
+  cumulative = np.cumsum(weights, axis=1)
+  totals = cumulative[:, -1]
+  if not (totals > 0).all():
+    raise ValueError('no legal move')
+  draws = np.random.random(len(weights)) * totals
+  return (cumulative <= draws[:, None]).sum(axis=1)
+
 class Human(Agent):
   def __init__(self):
     self.encoder_test = encoders.RelativeEncoder()
@@ -24,9 +48,7 @@ class Human(Agent):
       human_input = input("Select an index: ")
       try:
         human_input = int(human_input)
-        r = human_input // game.board.num_cols
-        c = human_input % game.board.num_cols
-        pt = Point(row = r+1, col = c+1)
+        pt = POINTS[human_input] if 0 <= human_input < NUM_POINTS else None
         if pt in open_spaces:
           return Move.play(pt)
         else:
@@ -46,6 +68,12 @@ class RandomAgent(Agent):
     return Move.play(open_spaces[np.random.choice(len(open_spaces))])
 
 
+def open_neighbors(game):
+  # The empty cells in the 3x3 block around the last move, row by row.
+  occupied = game.board.occupied_bits
+  return [ POINTS[idx] for idx in NEIGHBORHOODS[game.last_move.point.to_idx()] if not occupied >> idx & 1 ]
+
+
 class NeighborAgent(Agent):
   def __init__(self):
     pass
@@ -57,14 +85,7 @@ class NeighborAgent(Agent):
       open_spaces = game.board.return_open_spaces()
       return Move.play(open_spaces[np.random.choice(len(open_spaces))])
     
-    open_spaces = []
-    for r in [previous_move.point.row - 1, previous_move.point.row, previous_move.point.row + 1]:
-      for c in [previous_move.point.col - 1, previous_move.point.col, previous_move.point.col + 1]:
-        pt = Point(r, c)
-        try:
-          if game.board.is_on_grid(pt) > 0 and game.board.get(pt) is None:
-            open_spaces.append(pt)
-        except: pass
+    open_spaces = open_neighbors(game)
     if len(open_spaces) > 0:
       return Move.play(open_spaces[np.random.choice(len(open_spaces))])
     else: # no open neighbors, choose randomly
@@ -86,14 +107,7 @@ class GreedyAgent(Agent):
     if winning_move:
       return Move.play(winning_move)
 
-    open_spaces = []
-    for r in [previous_move.point.row - 1, previous_move.point.row, previous_move.point.row + 1]:
-      for c in [previous_move.point.col - 1, previous_move.point.col, previous_move.point.col + 1]:
-        pt = Point(r, c)
-        try:
-          if game.board.is_on_grid(pt) > 0 and game.board.get(pt) is None:
-            open_spaces.append(pt)
-        except: pass
+    open_spaces = open_neighbors(game)
     if len(open_spaces) == 0:
       open_spaces = game.board.return_open_spaces()
     
@@ -101,17 +115,21 @@ class GreedyAgent(Agent):
     return Move.play(open_spaces[np.random.choice(len(open_spaces))])
 
   def find_winning_move(self, game):
+    # Tries each candidate in place on game; push/pop leave it as it was.
     for candidate in game.board.return_open_spaces():
-      next_state = game.apply_move(Move.play(candidate))
-      if next_state.is_over() and next_state.winner == next_state.current_player.other:
+      game.push(PLAY_MOVES[candidate.to_idx()])
+      won = game.is_over() and game.winner == game.current_player.other
+      game.pop()
+      if won:
         return candidate
     return None
   
   def remove_losing_moves(self, game, open_spaces):
     okay_moves = []
     for candidate in open_spaces:
-      next_state = game.apply_move(Move.play(candidate))
-      opponent_winning_move = self.find_winning_move(next_state)
+      game.push(PLAY_MOVES[candidate.to_idx()])
+      opponent_winning_move = self.find_winning_move(game)
+      game.pop()
       if opponent_winning_move == None:
         okay_moves.append(candidate)
     if len(okay_moves) > 0:
@@ -119,6 +137,21 @@ class GreedyAgent(Agent):
     else:
       return open_spaces
 
+class SearchAgent(Agent):
+  # Alpha-beta search over bitboards (see canoebot.search); needs no model. Limited by
+  # depth only unless a time_budget (seconds per move) is given.
+  def __init__(self, max_depth=3, time_budget=None):
+    self.search = search.Search(max_depth=max_depth, time_budget=time_budget)
+    self.last_move_value = 0
+
+  def select_move(self, game):
+    point_idx, score = self.search.best_move(*search.position_bits(game))
+    self.last_move_value = score
+    return PLAY_MOVES[point_idx]
+
+  def diagnostics(self):
+    return {'value': self.last_move_value, 'depth': self.search.depth_reached, 'nodes': self.search.nodes}
+
 class DeepLearningAgent(Agent):
   def __init__(self, model, encoder):
     Agent.__init__(self)
@@ -144,6 +177,12 @@ class DeepLearningAgent(Agent):
       if game_state.is_valid_move(Move.play(point)):
         return Move.play(point)
 
+  def select_moves(self, game_states):
+    X = self.encoder.encode_batch(game_states)
+    move_probs = np.clip(self.model.predict(X) ** 3, 1e-5, 1 - 1e-5)
+    point_idxs = sample_legal_moves(move_probs, encoders.open_cells(game_states))
+    return [ PLAY_MOVES[idx] for idx in point_idxs ]
+
 class PolicyAgent(Agent):
   def __init__(self, model, encoder):
     self.model = model
@@ -177,7 +216,27 @@ class PolicyAgent(Agent):
           self.collector.record_decision(state=board_tensor, action=point_idx)
         return Move.play(point)
 
-  def train(self, experience, learning_rate, clipnorm, batch_size):
+  def select_moves(self, game_states):
+    num_moves = self.encoder.board_width * self.encoder.board_height
+    board_tensors = self.encoder.encode_batch(game_states)
+    # Rows exploring with probability temperature play uniformly and skip the network.
+    move_probs = np.ones((len(game_states), num_moves)) / num_moves
+    greedy = np.random.random(len(game_states)) >= self.temperature
+    if greedy.any():
+      move_probs[greedy] = self.model.predict(board_tensors[greedy])
+    move_probs = np.clip(move_probs, 1e-5, 1 - 1e-5)
+    point_idxs = sample_legal_moves(move_probs, encoders.open_cells(game_states))
+    if self.collector is not None:
+      for board_tensor, point_idx in zip(board_tensors, point_idxs):
+        self.collector.record_decision(state=board_tensor, action=point_idx)
+    return [ PLAY_MOVES[idx] for idx in point_idxs ]
+
+  def train(self, experience, learning_rate, clipnorm, batch_size, mirror=False):
+    if mirror:
+      # Mirror images are added batch by batch (see training.mirror_batches).
+      batches = training.mirror_batches(training.buffer_batches(experience, batch_size))
+      return training.train_policy(self.model, batches, learning_rate=learning_rate, clipnorm=clipnorm)
+    from tensorflow.keras.optimizers import SGD
     self.model.compile(loss='categorical_crossentropy', optimizer=SGD(learning_rate=learning_rate, clipnorm=clipnorm))
     target_vectors = prepare_experience_data(experience, self.encoder.board_width, self.encoder.board_height)
     self.model.fit(experience.states, target_vectors, batch_size=batch_size, epochs=1)
@@ -190,13 +249,7 @@ class PolicyAgent(Agent):
 
 # make Experience suitable for keras.fit
 def prepare_experience_data(experience, board_width, board_height):
-  experience_size = experience.actions.shape[0]
-  target_vectors = np.zeros((experience_size, board_width * board_height))
-  for i in range(experience_size):
-    action = experience.actions[i]
-    reward = experience.rewards[i]
-    target_vectors[i][action] = reward
-  return target_vectors
+  return training.policy_targets(experience.actions, experience.rewards, board_width * board_height)
 
 
 class IndexError(Exception):
@@ -204,11 +257,16 @@ class IndexError(Exception):
 
 
 class QAgent(Agent):
+  # model is either the two-input Q model, (board, one-hot move) -> value, or a single-input
+  # model returning the values of all num_points moves for a board (see
+  # utils.q_model_all_moves), which scores a position with one board row.
   def __init__(self, model, encoder):
     self.model = model
     self.encoder = encoder
     self.collector = None
     self.temperature = 0.0
+    inputs = getattr(model, 'inputs', None) or getattr(model, 'input_names', None) or ()
+    self.scores_all_moves = len(inputs) == 1
 #    self.last_move_value = 0
 
   def set_temperature(self, temperature):
@@ -217,28 +275,32 @@ class QAgent(Agent):
   def set_collector(self, collector):
     self.collector = collector
 
+  def q_values(self, board_tensors, legal):
+    # (N, num_points) values of the legal moves of N positions; -inf elsewhere.
+    values = np.full(legal.shape, -np.inf)
+    if self.scores_all_moves:
+      all_values = np.asarray(self.model.predict(board_tensors)).reshape(legal.shape)
+      values[legal] = all_values[legal]
+      return values
+    rows, points = np.nonzero(legal)
+    if len(board_tensors) == 1:
+      # Skips the fancy-indexing copy here, but predict still converts the view to one
+      # board row per move; utils.q_model_all_moves sends the board once.
+      board_rows = np.broadcast_to(board_tensors[0], (len(points),) + board_tensors.shape[1:])
+    else:
+      board_rows = board_tensors[rows]
+    move_vectors = np.eye(self.encoder.num_points())[points]
+    values[rows, points] = np.asarray(self.model.predict([board_rows, move_vectors])).reshape(len(points))
+    return values
+
   def select_move(self, game_state):
     board_tensor = self.encoder.encode(game_state)
-
-    moves = []
-    board_tensors = []
-    for move in game_state.legal_moves():
-      if not move.is_play:
-        continue
-      moves.append(self.encoder.encode_point(move.point))
-      board_tensors.append(board_tensor)
-    if not moves:
+    legal = encoders.open_cells([game_state])
+    moves = np.flatnonzero(legal[0])
+    if not len(moves):
       raise NotImplementedError() # never should happen
 
-    num_moves = len(moves)
-    board_tensors = np.array(board_tensors)
-    move_vectors = np.zeros( (num_moves, self.encoder.num_points()) )
-    for i, move in enumerate(moves):
-      move_vectors[i][move] = 1
-
-    values = self.model.predict( [board_tensors, move_vectors] )
-    values = values.reshape(len(moves))
-
+    values = self.q_values(board_tensor[np.newaxis], legal)[0][moves]
     ranked_moves = self.rank_moves_eps_greedy(values)
 
     for move_idx in ranked_moves:
@@ -247,20 +309,38 @@ class QAgent(Agent):
         self.collector.record_decision(state=board_tensor, action=moves[move_idx])
       return Move.play(point)
 
-
-  def train(self, experience, learning_rate=0.1, batch_size=128):
+  def select_moves(self, game_states):
+    board_tensors = self.encoder.encode_batch(game_states)
+    legal = encoders.open_cells(game_states)
+    values = self.q_values(board_tensors, legal)
+
+    explore = np.random.random(len(game_states)) < self.temperature
+    if explore.any():
+      values[explore] = np.where(legal[explore], np.random.random(legal[explore].shape), -np.inf)
+    point_idxs = np.argmax(values, axis=1)
+    if self.collector is not None:
+      for board_tensor, point_idx in zip(board_tensors, point_idxs):
+        self.collector.record_decision(state=board_tensor, action=point_idx)
+    return [ PLAY_MOVES[idx] for idx in point_idxs ]
+
+  def train(self, experience, learning_rate=0.1, batch_size=128, mirror=False):
+    if mirror:
+      batches = training.mirror_batches(training.buffer_batches(experience, batch_size))
+      return training.train_q(self.model, batches, learning_rate=learning_rate)
+    from tensorflow.keras.optimizers import SGD
     opt = SGD(learning_rate=learning_rate)
     self.model.compile(loss='mse', optimizer=opt)
 
     n = experience.states.shape[0]
-    num_moves = self.encoder.num_points()
-    y = np.zeros((n,))
-    actions = np.zeros((n, num_moves))
-    for i in range(n):
-      action = experience.actions[i]
-      reward = experience.rewards[i]
-      actions[i][action] = 1
-      y[i] = reward
+    if self.scores_all_moves:
+      # Targets are the model's own outputs except at the action taken, so only that
+      # output contributes to the loss.
+      y = np.asarray(self.model.predict(experience.states, batch_size=batch_size))
+      y[np.arange(n), experience.actions] = experience.rewards
+      self.model.fit(experience.states, y, batch_size=batch_size, epochs=1)
+      return
+    actions = np.eye(self.encoder.num_points())[experience.actions]
+    y = np.asarray(experience.rewards, dtype=np.float64)
     self.model.fit( [experience.states, actions], y, batch_size=batch_size, epochs=1)
 
   def rank_moves_eps_greedy(self, values):
@@ -283,19 +363,85 @@ class ACAgent(Agent):
     self.model = model
     self.encoder = encoder
     self.collector = None
+    self.cache = None
+    self.timings = None
     # self.last_state_value = 0
 
   def set_collector(self, collector):
     self.collector = collector
 
+  def set_cache(self, cache):
+    # cache is a canoebot.cache.PositionCache consulted before running the network.
+    self.cache = cache
+
+  def set_timings(self, timings):
+    # timings is a canoebot.timing.Timings recording the encode, forward and sampling
+    # phases of each move selection, or None to turn timing off.
+    self.timings = timings
+
+  def evaluate(self, games, board_tensors):
+    # Returns (policies, values) for a batch of positions, running the network only on
+    # positions missing from the cache.
+    if self.cache is None:
+      actions, values = self.model(board_tensors)
+      return np.asarray(actions), np.asarray(values)[:, 0]
+
+    policies = np.zeros((len(games), self.encoder.num_points()), dtype=np.float32)
+    values = np.zeros(len(games), dtype=np.float32)
+    misses = []
+    for i, game in enumerate(games):
+      cached = self.cache.lookup(game)
+      if cached is None:
+        misses.append(i)
+      else:
+        policies[i], values[i] = cached
+    if misses:
+      actions, miss_values = self.model(board_tensors[misses])
+      policies[misses] = np.asarray(actions)
+      values[misses] = np.asarray(miss_values)[:, 0]
+      for i in misses:
+        self.cache.store(games[i], policies[i], values[i])
+    return policies, values
+
   def select_move(self, game, verbose=False):
-    num_moves = self.encoder.board_width * self.encoder.board_height
+    timings = self.timings
+    start = time.perf_counter() if timings is not None else 0
     board_tensor = self.encoder.encode(game)
     X = np.array([board_tensor])
-
-    actions, values = self.model(X)
-    move_probs = actions[0]
-    estimated_value = values[0][0]
+    if timings is not None:
+      start = timings.lap('encode', start)
+
+    move_probs, values = self.evaluate([game], X)
+    if timings is not None:
+      start = timings.lap('forward', start)
+    move = self.move_from_policy(game, board_tensor, move_probs[0], values[0], verbose)
+    if timings is not None:
+      timings.lap('sampling', start)
+    return move
+
+  def select_moves(self, game_states):
+    timings = self.timings
+    start = time.perf_counter() if timings is not None else 0
+    board_tensors = self.encoder.encode_batch(game_states)
+    if timings is not None:
+      start = timings.lap('encode', start)
+    move_probs, values = self.evaluate(game_states, board_tensors)
+    if timings is not None:
+      start = timings.lap('forward', start)
+    move_probs = np.clip(move_probs, 1e-6, 1 - 1e-6)
+    point_idxs = sample_legal_moves(move_probs, encoders.open_cells(game_states))
+    if timings is not None:
+      timings.lap('sampling', start)
+    self.last_move_value = float(values[-1])
+    if self.collector is not None:
+      for board_tensor, point_idx, value in zip(board_tensors, point_idxs, values):
+        self.collector.record_decision(state=board_tensor, action=point_idx, estimated_value=value)
+    return [ PLAY_MOVES[idx] for idx in point_idxs ]
+
+  def move_from_policy(self, game, board_tensor, move_probs, estimated_value, verbose=False):
+    # Samples a legal move from one row of the network output; shared by select_move and
+    # the batched inference path in canoebot.batching.
+    num_moves = self.encoder.board_width * self.encoder.board_height
     self.last_move_value = float(estimated_value)
 
     # for rr in range(6):
@@ -317,8 +463,7 @@ class ACAgent(Agent):
 
         # Plot heatmaps
         if verbose:
-          for idx in [0, 3, 4, 5, 6, 7, 8, 9, 12, 52, 64, 65, 66, 67, 75, 76, 77]:
-            move_probs[idx] = np.nan
+          move_probs[list(OFF_GRID)] = np.nan
           heatmap = move_probs.reshape((6, 13))
           fig, ax = plt.subplots()
           im = ax.imshow(heatmap)
@@ -340,9 +485,53 @@ class ACAgent(Agent):
     raise ValueError
 
 
+  def train(self, experience, learning_rate=0.01, clipnorm=1.0, batch_size=512, mirror=False):
+    # In-memory counterpart of `python -m canoebot.training ac`, which streams from files.
+    batches = training.buffer_batches(experience, batch_size)
+    if mirror:
+      batches = training.mirror_batches(batches)
+    return training.train_ac(self.model, batches, learning_rate=learning_rate, clipnorm=clipnorm)
+
   def serialize(self, h5file):
     raise NotImplementedError()
 
   def diagnostics(self):
     return {'value': self.last_move_value}
 
+
+class MCTSAgent(Agent):
+  # Tree search using an ACAgent's policy as priors and its value head at the leaves (see
+  # canoebot.mcts). The tree below the chosen move is kept for the next move of the game.
+  def __init__(self, ac_agent, num_simulations=200, time_budget=None, batch_size=16, temperature=0.0, **mcts_options):
+    self.ac_agent = ac_agent
+    self.encoder = ac_agent.encoder
+    self.tree = mcts.MCTS(ac_agent, num_simulations=num_simulations, time_budget=time_budget,
+                          batch_size=batch_size, **mcts_options)
+    self.temperature = temperature
+    self.collector = None
+    self.last_move_value = 0
+
+  def set_collector(self, collector):
+    self.collector = collector
+
+  def select_move(self, game):
+    root = self.tree.run(game)
+    if root.terminal_value is not None:
+      # A finished game has no search statistics to pick from.
+      raise ValueError('game is over')
+    # Visit counts decide; priors only break ties (e.g. with no simulations run).
+    scores = root.visits + 1e-3 * root.priors
+    if self.temperature > 0:
+      probs = scores ** (1.0 / self.temperature)
+      i = np.random.choice(len(probs), p=probs / probs.sum())
+    else:
+      i = int(np.argmax(scores))
+    point_idx = int(root.moves[i])
+    self.last_move_value = root.value
+    if self.collector is not None:
+      self.collector.record_decision(state=self.encoder.encode(game), action=point_idx, estimated_value=root.value)
+    self.tree.advance(i)
+    return PLAY_MOVES[point_idx]
+
+  def diagnostics(self):
+    return {'value': self.last_move_value, 'batches': self.tree.num_batches}
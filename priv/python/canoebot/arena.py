@@ -0,0 +1,206 @@
+import math
+import multiprocessing
+import time
+
+import numpy as np
+
+import canoebot.agent as agent
+import canoebot.encoders as encoders
+import canoebot.utils as utils
+from canoebot.board import GameState, Player
+from canoebot.experience import ExperienceCollector, combine_experience
+
+__all__ = [
+    'make_agent',
+    'play_match',
+    'MatchResult',
+]
+
+# Agents are described by picklable spec strings so each pool worker can build its own:
+#   random | neighbor | greedy | search | policy:<model>[:<encoder>] | q:<model>[:<encoder>]
+#   | ac:<model>[:<encoder>] | mcts:<model>[:<encoder>] (MCTSAgent over an ACAgent)
+# Models are loaded from generated_models/ with utils.load_inference_model; the encoder
+# defaults to 'relative'.
+HEURISTIC_AGENTS = {
+    'random': agent.RandomAgent,
+    'neighbor': agent.NeighborAgent,
+    'greedy': agent.GreedyAgent,
+    'search': agent.SearchAgent,
+}
+NETWORK_AGENTS = {
+    'policy': agent.PolicyAgent,
+    'q': agent.QAgent,
+    'ac': agent.ACAgent,
+}
+
+
+def make_agent(spec):
+    kind, *args = spec.split(':')
+    if kind in HEURISTIC_AGENTS:
+        return HEURISTIC_AGENTS[kind]()
+    if (kind in NETWORK_AGENTS or kind == 'mcts') and 1 <= len(args) <= 2:
+        model_name, encoder_name = args if len(args) == 2 else (args[0], 'relative')
+        model, encoder = utils.load_inference_model(model_name), encoders.get_encoder_by_name(encoder_name)
+        if kind == 'mcts':
+            return agent.MCTSAgent(agent.ACAgent(model, encoder))
+        return NETWORK_AGENTS[kind](model, encoder)
+    raise ValueError(f"Unknown agent spec: {spec}")
+
+
+def wilson_interval(successes, n, z=1.96):
+    if n == 0:
+        return (0.0, 1.0)
+    p = successes / n
+    center = (p + z * z / (2 * n)) / (1 + z * z / n)
+    half_width = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / (1 + z * z / n)
+    return (max(0.0, center - half_width), min(1.0, center + half_width))
+
+
+class MatchResult():
+    def __init__(self, spec_a, spec_b, games, elapsed):
+        self.spec_a = spec_a
+        self.spec_b = spec_b
+        self.num_games = len(games)
+        self.elapsed = elapsed
+        self.wins_a = sum(1 for g in games if g['winner'] == 'a')
+        self.wins_b = sum(1 for g in games if g['winner'] == 'b')
+        self.draws = self.num_games - self.wins_a - self.wins_b
+        self.num_moves = sum(g['num_moves'] for g in games)
+        self.move_times_a = np.concatenate([g['move_times']['a'] for g in games] + [np.zeros(0)])
+        self.move_times_b = np.concatenate([g['move_times']['b'] for g in games] + [np.zeros(0)])
+        self.experience_a = None
+        self.experience_b = None
+
+    @property
+    def games_per_sec(self):
+        return self.num_games / self.elapsed if self.elapsed > 0 else float('inf')
+
+    def rate(self, count):
+        return count / self.num_games if self.num_games else 0.0
+
+    def latency(self, move_times):
+        if len(move_times) == 0:
+            return {}
+        p50, p95, p99 = np.percentile(move_times, [50, 95, 99])
+        return {'mean_ms': 1000 * move_times.mean(), 'p50_ms': 1000 * p50, 'p95_ms': 1000 * p95, 'p99_ms': 1000 * p99}
+
+    def summary(self):
+        return {
+            'a': self.spec_a,
+            'b': self.spec_b,
+            'games': self.num_games,
+            'win_rate_a': self.rate(self.wins_a),
+            'win_rate_a_95ci': wilson_interval(self.wins_a, self.num_games),
+            'win_rate_b': self.rate(self.wins_b),
+            'win_rate_b_95ci': wilson_interval(self.wins_b, self.num_games),
+            'draw_rate': self.rate(self.draws),
+            'draw_rate_95ci': wilson_interval(self.draws, self.num_games),
+            'games_per_sec': self.games_per_sec,
+            'moves_per_game': self.num_moves / self.num_games if self.num_games else 0.0,
+            'move_latency_a': self.latency(self.move_times_a),
+            'move_latency_b': self.latency(self.move_times_b),
+        }
+
+    def __str__(self):
+        s = self.summary()
+        lines = [f"{self.spec_a} (a) vs {self.spec_b} (b): {self.num_games} games, {s['games_per_sec']:.2f} games/sec"]
+        for label, key in (('a wins', 'win_rate_a'), ('b wins', 'win_rate_b'), ('draws', 'draw_rate')):
+            low, high = s[key + '_95ci']
+            lines.append(f"  {label:7s} {100 * s[key]:5.1f}%  (95% CI {100 * low:.1f}-{100 * high:.1f}%)")
+        for side in ('a', 'b'):
+            latency = s['move_latency_' + side]
+            if latency:
+                lines.append(f"  {side} move latency: mean {latency['mean_ms']:.2f}ms, p50 {latency['p50_ms']:.2f}ms, "
+                             f"p95 {latency['p95_ms']:.2f}ms, p99 {latency['p99_ms']:.2f}ms")
+        return "\n".join(lines)
+
+
+# Per-process state, filled in by _init_worker so models load once per worker, not per game.
+_worker = {}
+
+
+def _init_worker(spec_a, spec_b, collect, seed):
+    _worker['agents'] = {'a': make_agent(spec_a), 'b': make_agent(spec_b)}
+    _worker['collect'] = collect
+    _worker['seed'] = seed
+
+
+def _play_game(game_idx):
+    agents = _worker['agents']
+    np.random.seed((_worker['seed'] + game_idx) % 2**32)
+    # Alternate who moves first: side a is red in even-numbered games.
+    sides = {Player.red: 'a', Player.yellow: 'b'} if game_idx % 2 == 0 else {Player.red: 'b', Player.yellow: 'a'}
+    collectors = {}
+    if _worker['collect']:
+        for side, side_agent in agents.items():
+            if hasattr(side_agent, 'set_collector'):
+                collectors[side] = ExperienceCollector()
+                collectors[side].begin_episode()
+                side_agent.set_collector(collectors[side])
+
+    move_times = {'a': [], 'b': []}
+    game = GameState.new_game()
+    num_moves = 0
+    while not game.is_over():
+        side = sides[game.current_player]
+        start = time.perf_counter()
+        move = agents[side].select_move(game)
+        move_times[side].append(time.perf_counter() - start)
+        game.push(move)
+        num_moves += 1
+
+    winner = sides.get(game.winner)
+    for side, collector in collectors.items():
+        reward = 0 if winner is None else (1 if winner == side else -1)
+        collector.complete_episode(reward)
+        agents[side].set_collector(None)
+    return {
+        'winner': winner,
+        'num_moves': num_moves,
+        'move_times': { side: np.array(times) for side, times in move_times.items() },
+        'experience': { side: collector.to_buffer() for side, collector in collectors.items() },
+    }
+
+
+def play_match(spec_a, spec_b, num_games, processes=None, collect_experience=False, seed=0):
+    """Plays num_games between two agent specs, alternating the first player.
+
+    Games are spread over a process pool (processes=1 plays in this process). With
+    collect_experience, agents that accept a collector record their decisions and the
+    combined ExperienceBuffers are returned as result.experience_a / experience_b.
+    """
+    start = time.perf_counter()
+    initargs = (spec_a, spec_b, collect_experience, seed)
+    if processes == 1:
+        _init_worker(*initargs)
+        games = [ _play_game(i) for i in range(num_games) ]
+    else:
+        with multiprocessing.Pool(processes, initializer=_init_worker, initargs=initargs) as pool:
+            games = pool.map(_play_game, range(num_games), chunksize=max(1, num_games // (8 * (processes or multiprocessing.cpu_count()))))
+    result = MatchResult(spec_a, spec_b, games, time.perf_counter() - start)
+    if collect_experience:
+        for side in ('a', 'b'):
+            buffers = [ g['experience'][side] for g in games if side in g['experience'] ]
+            if any(len(b.actions) > 0 for b in buffers):
+                setattr(result, 'experience_' + side, combine_experience(buffers))
+    return result
+
+
+def main():
+    import argparse
+    import json
+    parser = argparse.ArgumentParser(description="Play two canoebot agents against each other.")
+    parser.add_argument('agent_a', help="e.g. greedy, ac:ac-v12, policy:my-model:relative")
+    parser.add_argument('agent_b')
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--processes', type=int, default=None, help="defaults to the number of CPUs")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    result = play_match(args.agent_a, args.agent_b, args.games, processes=args.processes, seed=args.seed)
+    print(json.dumps(result.summary(), indent=2) if args.json else result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+__all__ = [
+    'InferenceBatcher',
+    'select_moves_batched',
+]
+
+
+def select_moves_batched(agent, game_states):
+    # Kept for existing callers; batching now lives in Agent.select_moves.
+    return agent.select_moves(game_states)
+
+
+class InferenceBatcher():
+    """Groups positions submitted from concurrent callers into one network call.
+
+    A collector thread waits for the first pending request, then keeps collecting until
+    it has max_batch_size positions or max_wait seconds have passed, and runs them
+    through agent.select_moves. submit() returns a Future resolving to the Move.
+    """
+    def __init__(self, agent, max_batch_size=32, max_wait=0.005):
+        self.agent = agent
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.num_batches = 0
+        self.num_requests = 0
+        self._requests = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._collect, name='canoebot-batcher', daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._requests.put(None)
+            thread.join()
+
+    def submit(self, game_state):
+        if self._thread is None:
+            self.start()
+        future = Future()
+        self._requests.put((game_state, future))
+        return future
+
+    def select_move(self, game_state, timeout=None):
+        return self.submit(game_state).result(timeout)
+
+    def _collect(self):
+        while True:
+            request = self._requests.get()
+            if request is None:
+                return
+            batch = [request]
+            deadline = time.monotonic() + self.max_wait
+            stopping = False
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if request is None:
+                    stopping = True
+                    break
+                batch.append(request)
+            self._run(batch)
+            if stopping:
+                return
+
+    def _run(self, batch):
+        game_states = [game_state for game_state, _ in batch]
+        self.num_batches += 1
+        self.num_requests += len(batch)
+        try:
+            moves = self.agent.select_moves(game_states)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), move in zip(batch, moves):
+            future.set_result(move)
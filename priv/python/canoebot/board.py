@@ -1,7 +1,11 @@
-import copy
 import enum
-from collections import namedtuple
+from array import array
 import numpy as np
+from canoebot.geometry import (
+    CANOE_BITS_THROUGH, CANOE_DISJOINT, CANOE_MASKS, CANOES_THROUGH, COMPLETION_MASKS, MIRROR_IDX,
+    NUM_COLS, NUM_POINTS, NUM_ROWS, OFF_GRID, ON_GRID_IDX, ON_GRID_MASK, POINTS, Point,
+    point_from_idx, solns, solns_dict,
+)
 
 __all__ = [
     'Board',
@@ -9,18 +13,6 @@ __all__ = [
     'Move',
 ]
 
-class Point(namedtuple('Point', 'row col')):
-    def neighbors(self):
-        return [
-            Point(self.row - 1, self.col),
-            Point(self.row + 1, self.col),
-            Point(self.row, self.col - 1),
-            Point(self.row, self.col + 1)
-        ]
-    
-    def to_idx(self):
-        return 13 * (self.row - 1) + (self.col - 1)
-
 class Move():
     # optional expansions: resigning, draws etc.
     def __init__(self, point):
@@ -40,30 +32,97 @@ class Player(enum.Enum):
     def other(self):
         return Player.red if self == Player.yellow else Player.yellow
 
+def popcount(bits):
+    return bin(bits).count("1")
+
+if hasattr(int, 'bit_count'): # Python 3.10+
+    popcount = int.bit_count
+
+def iter_bits(bits):
+    # Yields the indices of the set bits, lowest first.
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+def bits_to_array(bits):
+    packed = np.frombuffer(bits.to_bytes(10, 'little'), dtype=np.uint8)
+    return np.unpackbits(packed, bitorder='little')[:NUM_POINTS].astype(bool)
+
+def _read_only(array):
+    array.flags.writeable = False
+    return array
+
+def array_to_bits(array):
+    packed = np.packbits(np.asarray(array, dtype=bool).ravel(), bitorder='little')
+    return int.from_bytes(packed.tobytes(), 'little')
+
+_ROW_MASK = (1 << NUM_COLS) - 1
+
+def mirror_bits(bits):
+    mirrored = 0
+    for r in range(NUM_ROWS):
+        row = bits >> (NUM_COLS * r) & _ROW_MASK
+        if row:
+            mirrored |= int(format(row, '013b')[::-1], 2) << (NUM_COLS * r)
+    return mirrored
+
+# One shared Move per index, like geometry.POINTS, so hot paths don't allocate them.
+PLAY_MOVES = tuple(Move.play(point) for point in POINTS)
+
 class Board():
     def __init__(self):
-        self.num_rows = 6
-        self.num_cols = 13
-        self.reds = np.zeros(78, dtype=bool)
-        self.yellows = np.zeros(78, dtype=bool)
-        self.open_spaces = 61
+        self.num_rows = NUM_ROWS
+        self.num_cols = NUM_COLS
+        self.red_bits = 0
+        self.yellow_bits = 0
         self.last_move = None
 
+    # reds/yellows are kept as numpy arrays of the bitboards for existing callers. They
+    # are read-only snapshots, since writing a cell would not reach the bitboard;
+    # assigning to them replaces the whole bitboard.
+    @property
+    def reds(self):
+        return _read_only(bits_to_array(self.red_bits))
+
+    @reds.setter
+    def reds(self, value):
+        self.red_bits = array_to_bits(value)
+
+    @property
+    def yellows(self):
+        return _read_only(bits_to_array(self.yellow_bits))
+
+    @yellows.setter
+    def yellows(self, value):
+        self.yellow_bits = array_to_bits(value)
+
+    @property
+    def occupied_bits(self):
+        return self.red_bits | self.yellow_bits
+
+    @property
+    def open_spaces(self):
+        return popcount(ON_GRID_MASK & ~self.occupied_bits)
+
+    def player_bits(self, player):
+        return self.red_bits if player == Player.red else self.yellow_bits
+
     def print_board(self, winning_canoes=None):
         print("")
         counter = 0
         for r in range(1, self.num_rows + 1):
             for c in range(1, self.num_cols + 1):
-                pt = Point(r, c)
+                bit = 1 << counter
                 symbol = "□"
                 if winning_canoes is not None:
                     if counter in winning_canoes[0] or counter in winning_canoes[1]:
                         symbol = "■"
-                if not self.is_on_grid(pt):
+                if not ON_GRID_MASK & bit:
                     print("  ", end=" ")
-                elif self.reds[counter]:
+                elif self.red_bits & bit:
                     print(f"\033[91m {symbol}\033[0m", end=" ")
-                elif self.yellows[counter]:
+                elif self.yellow_bits & bit:
                     print(f"\033[93m {symbol}\033[0m", end=" ")
                 else:
                     print(f"{counter:02d}\033[0m", end=" ")
@@ -73,143 +132,184 @@ class Board():
         
     def place_peg(self, player, point):
         assert self.is_on_grid(point)
-        assert self.get(point) is None
+        bit = 1 << point.to_idx()
+        assert not self.occupied_bits & bit
         if player == Player.red:
-            self.reds[point.to_idx()] = True
+            self.red_bits |= bit
         else:
-            self.yellows[point.to_idx()] = True
+            self.yellow_bits |= bit
         self.last_move = point
-        self.open_spaces -= 1
+
+    def remove_peg(self, player, point):
+        bit = 1 << point.to_idx()
+        if player == Player.red:
+            assert self.red_bits & bit
+            self.red_bits &= ~bit
+        else:
+            assert self.yellow_bits & bit
+            self.yellow_bits &= ~bit
+
+    def open_indices(self):
+        occupied = self.red_bits | self.yellow_bits
+        return [ idx for idx in ON_GRID_IDX if not occupied >> idx & 1 ]
 
     def return_open_spaces(self):
-        open_spaces = []
-        for r in range(1, self.num_rows + 1):
-            for c in range(1, self.num_cols + 1):
-                pt = Point(r, c)
-                if self.is_on_grid(pt) and self.get(pt) is None:
-                    open_spaces.append(pt)
-        return open_spaces
+        return [ POINTS[idx] for idx in self.open_indices() ]
         
     def is_on_grid(self, point):
-        idx = point.to_idx()
-        if idx in [0, 3, 4, 5, 6, 7, 8, 9, 12, 52, 64, 65, 66, 67, 75, 76, 77]:
+        if not (1 <= point.row <= self.num_rows and 1 <= point.col <= self.num_cols):
             return False
-        return 1 <= point.row <= self.num_rows and 1 <= point.col <= self.num_cols
+        return bool(ON_GRID_MASK >> point.to_idx() & 1)
 
     def get(self, point):
-        if self.reds[point.to_idx()]:
+        bit = 1 << point.to_idx()
+        if self.red_bits & bit:
             return Player.red
-        elif self.yellows[point.to_idx()]:
+        elif self.yellow_bits & bit:
             return Player.yellow
         else:
             return None
 
-    def __deepcopy__(self, memodict={}):
+    def copy(self):
         copied = Board()
-        copied.reds = np.copy(self.reds)
-        copied.yellows = np.copy(self.yellows)
-        copied.open_spaces = np.copy(self.open_spaces)
+        copied.red_bits = self.red_bits
+        copied.yellow_bits = self.yellow_bits
+        copied.last_move = self.last_move
         return copied
 
-b = Board()
-solns = []
-print("Initializing Canoe AI: building solutions...")
-for r in range(1, b.num_rows): # \__/
-    for c in range(1, b.num_cols):
-        if False not in (b.is_on_grid(Point(r, c)), b.is_on_grid(Point(r, c+3)), b.is_on_grid(Point(r+1, c+1)), b.is_on_grid(Point(r+1, c+2))):
-            solns.append( (Point(r, c).to_idx(), Point(r, c+3).to_idx(), Point(r+1, c+1).to_idx(), Point(r+1, c+2).to_idx() ) )
-for r in range(1, b.num_rows): # /~~\
-    for c in range(1, b.num_cols):
-        if False not in ( b.is_on_grid(Point(r, c+1)),  b.is_on_grid(Point(r, c+2)),  b.is_on_grid(Point(r+1, c)),  b.is_on_grid(Point(r+1, c+3))):
-            solns.append( ( Point(r, c+1).to_idx(),  Point(r, c+2).to_idx(),  Point(r+1, c).to_idx(),  Point(r+1, c+3).to_idx()) )
-for r in range(1, b.num_rows): # (
-    for c in range(1, b.num_cols):
-        if False not in (b.is_on_grid(Point(r, c+1)), b.is_on_grid(Point(r+1, c)), b.is_on_grid(Point(r+2, c)), b.is_on_grid(Point(r+3, c+1))):
-            solns.append( (Point(r, c+1).to_idx(), Point(r+1, c).to_idx(), Point(r+2, c).to_idx(), Point(r+3, c+1).to_idx()) )
-for r in range(1, b.num_rows): # )
-    for c in range(1, b.num_cols):
-        if False not in (b.is_on_grid(Point(r, c)), b.is_on_grid(Point(r+1, c+1)), b.is_on_grid(Point(r+2, c+1)), b.is_on_grid(Point(r+3, c))):
-            solns.append( (Point(r, c).to_idx(), Point(r+1, c+1).to_idx(), Point(r+2, c+1).to_idx(), Point(r+3, c).to_idx()) )
-soln_counter = 0
-solns_dict = {}
-for idx in range(78):
-    solns_dict[idx] = []
-    for soln in solns:
-        if idx in soln:
-            tuple3 = tuple([el for el in soln if el != idx])
-            solns_dict[idx].append(tuple3)
-            soln_counter += 1
-print(f"There are {soln_counter} canoes.")
+    def __deepcopy__(self, memodict={}):
+        return self.copy()
+
+def completed_canoes(bits):
+    # The canoes fully covered by bits, as a bitset over solns indices.
+    canoes = 0
+    for k, mask in enumerate(CANOE_MASKS):
+        if bits & mask == mask:
+            canoes |= 1 << k
+    return canoes
 
 class GameState():
+    # Moves are made in place with push() and taken back with pop(); the moves pushed
+    # since construction are kept as cell indices in `history`, one byte each. The
+    # previous/move given to the constructor describe the state pop() unwinds to.
+    # Each player's completed canoes are kept as bitsets over solns indices, computed
+    # from the board on first use and then updated by push/pop. is_over() is cached
+    # until the next push/pop.
     def __init__(self, board, current_player, previous, move):
         self.board = board
         self.current_player = current_player
-        self.previous_state = previous
         self.last_move = move
         self.winner = None
         self.winning_canoes = None
         self.solns = solns
         self.solns_dict = solns_dict
-        
+        self.history = array('B')
+        self._base_previous = previous
+        self._base_move = move
+        self._canoes = None
+        self._over = None
+
+    @property
+    def previous_state(self):
+        # Rebuilt from the history on demand, so states don't keep a chain of boards alive.
+        if not self.history:
+            return self._base_previous
+        previous = self.copy()
+        previous.pop()
+        return previous
+
     def print_board(self):
         self.board.print_board(self.winning_canoes)
 
-    def apply_move(self, move):
-        if move.is_play:
-            next_board = copy.deepcopy(self.board)
-            next_board.place_peg(self.current_player, move.point)
-        return GameState(next_board, self.current_player.other, self, move)
+    def copy(self):
+        copied = GameState(self.board.copy(), self.current_player, self._base_previous, self._base_move)
+        copied.last_move = self.last_move
+        copied.winner = self.winner
+        copied.winning_canoes = self.winning_canoes
+        copied.history = array('B', self.history)
+        copied._canoes = dict(self._canoes) if self._canoes is not None else None
+        copied._over = self._over
+        return copied
+
+    def completed_canoes(self, player):
+        if self._canoes is None:
+            self._canoes = {
+                Player.red: completed_canoes(self.board.red_bits),
+                Player.yellow: completed_canoes(self.board.yellow_bits),
+            }
+        return self._canoes[player]
+
+    def push(self, move):
+        idx = move.point.to_idx()
+        player = self.current_player
+        self.board.place_peg(player, move.point)
+        if self._canoes is not None:
+            bits = self.board.player_bits(player)
+            for k in CANOES_THROUGH[idx]:
+                if bits & CANOE_MASKS[k] == CANOE_MASKS[k]:
+                    self._canoes[player] |= 1 << k
+        self.history.append(idx)
+        self.current_player = player.other
+        self.last_move = move
+        self.winner = None
+        self.winning_canoes = None
+        self._over = None
 
+    def pop(self):
+        # Takes back the last pushed move and returns it.
+        idx = self.history.pop()
+        self.current_player = self.current_player.other
+        self.board.remove_peg(self.current_player, POINTS[idx])
+        if self._canoes is not None:
+            self._canoes[self.current_player] &= ~CANOE_BITS_THROUGH[idx]
+        self.last_move = PLAY_MOVES[self.history[-1]] if self.history else self._base_move
+        self.board.last_move = self.last_move.point if self.last_move is not None else None
+        self.winner = None
+        self.winning_canoes = None
+        self._over = None
+        return PLAY_MOVES[idx]
+
+    def apply_move(self, move):
+        next_state = self.copy()
+        next_state.push(move)
+        return next_state
 
     def completes_canoe(self, pt, player):
-        if player == Player.red:
-            moves = self.board.reds
-        else:
-            moves = self.board.yellows
-        pt_idx = pt.to_idx()
-        for s in self.solns_dict[pt_idx]:
-            if all(moves[elem] for elem in s):
+        moves = self.board.player_bits(player)
+        for mask in COMPLETION_MASKS[pt.to_idx()]:
+            if moves & mask == mask:
                 return True
-            else:
-                pass
         return False
 
     def is_over(self):
+        if self._over is None:
+            self._over = self._check_over()
+        return self._over
+
+    def _check_over(self):
         if self.last_move is None:
             return False
         if self.board.open_spaces <= 0:
             self.winner = 0
             return True
-        if self.current_player.other == Player.red: # apply_move just called by current_player.other
-            moves = self.board.reds
-            winner = self.current_player.other
-        else:
-            moves = self.board.yellows
-            winner = self.current_player.other
-        last_move_id = self.last_move.point.to_idx()
-        for s in self.solns_dict[last_move_id]:
-            if all(moves[elem] for elem in s):
-                new_canoe = True
-                break
-            else:
-                new_canoe = False
-        if new_canoe:
-            canoes = []
-            for s in self.solns:
-                if all(moves[elem] for elem in s):
-                    canoes.append(s)
-            if len(canoes) >= 2:
-                for c1 in canoes:
-                    for c2 in canoes:
-                        if not any(cc in c2 for cc in c1):
-                            self.winner = winner
-                            self.winning_canoes = [c1, c2]
-                            return True
+        winner = self.current_player.other # apply_move just called by current_player.other
+        moves = self.board.player_bits(winner)
+        if not any(moves & mask == mask for mask in COMPLETION_MASKS[self.last_move.point.to_idx()]):
+            return False
+        # The first pair of disjoint canoes in solns order: the lowest canoe with a
+        # disjoint partner, then its lowest partner.
+        canoes = self.completed_canoes(winner)
+        for c1 in iter_bits(canoes):
+            partners = CANOE_DISJOINT[c1] & canoes
+            if partners:
+                c2 = (partners & -partners).bit_length() - 1
+                self.winner = winner
+                self.winning_canoes = [self.solns[c1], self.solns[c2]]
+                return True
         return False
 
     def legal_moves(self):
-        return [ Move.play(pt) for pt in self.board.return_open_spaces() ]
+        return [ PLAY_MOVES[idx] for idx in self.board.open_indices() ]
 
     def is_valid_move(self, move):
         if self.is_over():
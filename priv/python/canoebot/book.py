@@ -0,0 +1,146 @@
+import numpy as np
+
+from canoebot.board import PLAY_MOVES, GameState, Player, mirror_bits
+from canoebot.geometry import MIRROR_IDX
+
+__all__ = [
+    'OpeningBook',
+    'build_book',
+]
+
+# An opening book maps early positions to a distribution over moves. It is one .npy
+# array of ENTRY rows sorted by key, one row per (position, move), so it can be
+# memory-mapped and searched in place with np.searchsorted. A key is the position's
+# reds and yellows bitboards (10 bytes each, big-endian so byte order is numeric order)
+# and the player to move; positions are stored mirror-reduced, like PositionCache keys.
+ENTRY = np.dtype([('key', 'S21'), ('move', 'u1'), ('weight', '<f4')])
+
+# Books sit next to the model they were built with: generated_models/ac-v12.book.npy.
+BOOK_EXTENSION = '.book.npy'
+
+
+def position_key(reds, yellows, player):
+    # (key bytes, is_mirrored) for the canonical orientation of the position.
+    mirrored = (mirror_bits(reds), mirror_bits(yellows))
+    is_mirrored = mirrored < (reds, yellows)
+    if is_mirrored:
+        reds, yellows = mirrored
+    return reds.to_bytes(10, 'big') + yellows.to_bytes(10, 'big') + bytes([player.value]), is_mirrored
+
+
+def game_key(game_state):
+    board = game_state.board
+    return position_key(board.red_bits, board.yellow_bits, game_state.current_player)
+
+
+class OpeningBook():
+    def __init__(self, entries):
+        # Plain ndarray views of the (possibly memory-mapped) table: slicing a memmap
+        # builds a new memmap object on every lookup.
+        self.entries = np.asarray(entries)
+        self.keys = self.entries['key']
+        self.move_column = self.entries['move']
+        self.weight_column = self.entries['weight']
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def load(cls, path):
+        return cls(np.load(path, mmap_mode='r'))
+
+    def save(self, path):
+        np.save(path, np.asarray(self.entries))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def moves(self, game_state):
+        # (point indices, weights) for game_state, or None when it isn't in the book.
+        key, is_mirrored = game_key(game_state)
+        lo = np.searchsorted(self.keys, key, side='left')
+        hi = np.searchsorted(self.keys, key, side='right')
+        if lo == hi:
+            return None
+        moves = self.move_column[lo:hi].tolist()
+        if is_mirrored:
+            moves = [ MIRROR_IDX[idx] for idx in moves ]
+        return moves, self.weight_column[lo:hi]
+
+    def select_move(self, game_state):
+        # A move sampled from the book's distribution, or None on a miss.
+        found = self.moves(game_state)
+        if found is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        moves, weights = found
+        cumulative = np.cumsum(weights)
+        choice = min(int(np.searchsorted(cumulative, np.random.random() * cumulative[-1], side='right')), len(moves) - 1)
+        return PLAY_MOVES[moves[choice]]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+def build_book(agent, plies=8, games=10000, min_count=20, first_player=Player.red):
+    """Plays the first `plies` moves of `games` self-play games with agent, advancing all
+    games together through agent.select_moves, and returns an OpeningBook of the moves
+    played in every position reached at least min_count times, weighted by frequency."""
+    counts = {}
+    states = [ GameState.new_game(first_player) for _ in range(games) ]
+    for _ in range(plies):
+        states = [ s for s in states if not s.is_over() ]
+        if not states:
+            break
+        for state, move in zip(states, agent.select_moves(states)):
+            key, is_mirrored = game_key(state)
+            idx = move.point.to_idx()
+            position = counts.setdefault(key, {})
+            idx = MIRROR_IDX[idx] if is_mirrored else idx
+            position[idx] = position.get(idx, 0) + 1
+            state.push(move)
+
+    rows = []
+    for key, moves in counts.items():
+        total = sum(moves.values())
+        if total < min_count:
+            continue
+        for idx, n in moves.items():
+            rows.append((key, idx, n / total))
+    entries = np.array(rows, dtype=ENTRY)
+    entries.sort(order=['key', 'move'])
+    return OpeningBook(entries)
+
+
+def main():
+    # python -m canoebot.book ac-v12 --plies 8 --games 20000: writes generated_models/ac-v12.book.npy
+    import argparse
+    import time
+    from canoebot.arena import make_agent
+    from canoebot.registry import ModelRegistry
+    parser = argparse.ArgumentParser(description="Build an opening book from self-play.")
+    parser.add_argument('model', help="model name in generated_models/; played as an ACAgent")
+    parser.add_argument('--agent', help="agent spec to play instead, as in canoebot.arena")
+    parser.add_argument('--plies', type=int, default=8)
+    parser.add_argument('--games', type=int, default=10000)
+    parser.add_argument('--min-count', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    np.random.seed(args.seed)
+    start = time.perf_counter()
+    book = build_book(make_agent(args.agent or f'ac:{args.model}'), args.plies, args.games, args.min_count)
+    path = ModelRegistry().path(args.model, extension=BOOK_EXTENSION)
+    book.save(path)
+    positions = len(np.unique(np.asarray(book.keys)))
+    print(f'Wrote {positions} positions ({len(book)} moves) to {path} in {time.perf_counter() - start:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+from collections import OrderedDict
+
+import numpy as np
+
+from canoebot.board import mirror_bits
+from canoebot.geometry import MIRROR_PERMUTATION
+
+__all__ = [
+    'PositionCache',
+]
+
+
+class PositionCache():
+    """LRU cache of network outputs (policy vector, value) keyed by position.
+
+    A position and its left-right mirror image share one entry: the key is the smaller
+    of (reds, yellows, player) and its mirrored bitboards, and the stored policy is in
+    that canonical orientation. Lookups of the mirrored side get the policy mapped back.
+    """
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def canonical_key(game_state):
+        reds, yellows = game_state.board.red_bits, game_state.board.yellow_bits
+        player = game_state.current_player.value
+        key = (reds, yellows, player)
+        mirrored = (mirror_bits(reds), mirror_bits(yellows), player)
+        return (mirrored, True) if mirrored < key else (key, False)
+
+    def lookup(self, game_state):
+        key, is_mirrored = self.canonical_key(game_state)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        policy, value = entry
+        return (policy[MIRROR_PERMUTATION] if is_mirrored else policy), value
+
+    def store(self, game_state, policy, value):
+        key, is_mirrored = self.canonical_key(game_state)
+        policy = np.array(policy, dtype=np.float32)
+        if is_mirrored:
+            policy = policy[MIRROR_PERMUTATION]
+        self._entries[key] = (policy, float(value))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
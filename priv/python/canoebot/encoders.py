@@ -1,5 +1,28 @@
 import numpy as np
-from canoebot.board import Point, Player
+from canoebot.board import Player
+from canoebot.geometry import CANOE_INCIDENCE, NUM_POINTS, ON_GRID, POINTS
+
+def stack_pegs(game_states):
+    # Returns (reds, yellows, yellow_to_move): two (N, 78) bool arrays and an (N,) bool array.
+    n = len(game_states)
+    raw = b''.join(
+        s.board.red_bits.to_bytes(10, 'little') + s.board.yellow_bits.to_bytes(10, 'little')
+        for s in game_states)
+    packed = np.frombuffer(raw, dtype=np.uint8).reshape(n, 2, 10)
+    pegs = np.unpackbits(packed, axis=2, bitorder='little')[:, :, :NUM_POINTS].astype(bool)
+    yellow_to_move = np.array([s.current_player == Player.yellow for s in game_states], dtype=bool)
+    return pegs[:, 0], pegs[:, 1], yellow_to_move
+
+def open_cells(game_states):
+    # (N, 78) bool array of the cells each position's player to move may play.
+    reds, yellows, _ = stack_pegs(game_states)
+    return ON_GRID & ~(reds | yellows)
+
+def completion_cells(pegs):
+    # For (N, 78) peg masks, marks every cell that is the last missing cell of some canoe.
+    # Callers mask the result with the empty cells: the other cells of such a canoe are pegged.
+    counts = pegs.astype(np.float32) @ CANOE_INCIDENCE
+    return ((counts == 3).astype(np.float32) @ CANOE_INCIDENCE.T) > 0
 
 class Encoder:
     def name(self):
@@ -7,12 +30,16 @@ class Encoder:
         
     def encode(self, game_state):
         raise NotImplementedError()
+
+    def encode_batch(self, game_states, dtype=None):
+        return np.array([self.encode(game_state) for game_state in game_states], dtype=dtype)
         
+    # All encoders index points like canoebot.geometry.
     def encode_point(self, point):
-        raise NotImplementedError()
-        
+        return point.to_idx()
+
     def decode_point_index(self, index):
-        raise NotImplementedError()
+        return POINTS[index]
         
     def num_points(self):
         raise NotImplementedError()
@@ -21,33 +48,23 @@ class Encoder:
         raise NotImplementedError()
 
 class OnePlaneEncoder(Encoder):
-    def __init__(self):
+    def __init__(self, dtype=np.float64):
         self.board_height = 6
         self.board_width = 13
         self.num_planes = 1
+        self.dtype = dtype
     
     def name(self):
         return 'oneplane'
 
     def encode(self, game_state):
-        board_tensor = np.zeros(self.shape())
-        current_player = game_state.current_player
-        for r in range(self.board_height):
-            for c in range(self.board_width):
-                p = Point(row = r+1, col = c+1)
-                if game_state.board.get(p) == current_player:
-                    board_tensor[r, c, 0] = 1
-                else:
-                    board_tensor[r, c, 0] = -1
-        return board_tensor
+        return self.encode_batch([game_state])[0]
 
-    def encode_point(self, point):
-        return self.board_width * (point.row - 1) + (point.col - 1)
-    
-    def decode_point_index(self, index):
-        r = index // self.board_width
-        c = index % self.board_width
-        return Point(row = r+1, col = c+1)
+    def encode_batch(self, game_states, dtype=None):
+        reds, yellows, yellow_to_move = stack_pegs(game_states)
+        mine = np.where(yellow_to_move[:, None], yellows, reds)
+        board_tensors = np.where(mine, 1, -1).astype(dtype or self.dtype)
+        return board_tensors.reshape((len(game_states),) + self.shape())
 
     def num_points(self):
         return self.board_width * self.board_height
@@ -59,10 +76,11 @@ class OnePlaneEncoder(Encoder):
 
 
 class SixPlaneEncoder(Encoder):
-    def __init__(self):
+    def __init__(self, dtype=np.float64):
         self.board_height = 6
         self.board_width = 13
         self.num_planes = 6
+        self.dtype = dtype
         # 0. red points
         # 1. yellow points
         # 2. completes red canoe
@@ -74,35 +92,20 @@ class SixPlaneEncoder(Encoder):
         return 'sixplane'
 
     def encode(self, game_state):
-        board_tensor = np.zeros(self.shape())
-        current_player = game_state.current_player
-        if current_player == Player.red:
-            board_tensor[:, :, 4] = 1
-        else:
-            board_tensor[:, :, 5] = 1
-
-        for r in range(self.board_height):
-            for c in range(self.board_width):
-                p = Point(row = r+1, col = c+1)
-                occupied = game_state.board.get(p)
-                if occupied == None: # empty, check if completes canoe
-                    if game_state.completes_canoe(p, Player.red):
-                        board_tensor[r][c][2] = 1
-                    if game_state.completes_canoe(p, Player.yellow):
-                        board_tensor[r][c][3] = 1
-                elif occupied == Player.red:
-                    board_tensor[r][c][0] = 1
-                else:
-                    board_tensor[r][c][1] = 1
-        return board_tensor
-
-    def encode_point(self, point):
-        return self.board_width * (point.row - 1) + (point.col - 1)
-    
-    def decode_point_index(self, index):
-        r = index // self.board_width
-        c = index % self.board_width
-        return Point(row = r+1, col = c+1)
+        return self.encode_batch([game_state])[0]
+
+    def encode_batch(self, game_states, dtype=None):
+        reds, yellows, yellow_to_move = stack_pegs(game_states)
+        empty = ~(reds | yellows)
+        n = len(game_states)
+        board_tensors = np.zeros((n, NUM_POINTS, self.num_planes), dtype=dtype or self.dtype)
+        board_tensors[:, :, 0] = reds
+        board_tensors[:, :, 1] = yellows
+        board_tensors[:, :, 2] = empty & completion_cells(reds)
+        board_tensors[:, :, 3] = empty & completion_cells(yellows)
+        board_tensors[:, :, 4] = ~yellow_to_move[:, None]
+        board_tensors[:, :, 5] = yellow_to_move[:, None]
+        return board_tensors.reshape((n,) + self.shape())
 
     def num_points(self):
         return self.board_width * self.board_height
@@ -114,10 +117,11 @@ class SixPlaneEncoder(Encoder):
 
 
 class RelativeEncoder(Encoder):
-    def __init__(self):
+    def __init__(self, dtype=np.float64):
         self.board_height = 6
         self.board_width = 13
         self.num_planes = 6
+        self.dtype = dtype
         # 0. current player: 0 = red, 1 = yellow
         # 1. current_player pegs
         # 2. opponent pegs
@@ -129,36 +133,22 @@ class RelativeEncoder(Encoder):
         return 'relative'
 
     def encode(self, game_state):
-        board_tensor = np.zeros(self.shape())
-        current_player = game_state.current_player
-        next_player = game_state.current_player.other
-        if current_player == Player.yellow:
-            board_tensor[0, :, :] = 1
-
-        for r in range(self.board_height):
-            for c in range(self.board_width):
-                p = Point(row = r+1, col = c+1)
-                occupied = game_state.board.get(p)
-                if occupied == None: # empty, check if completes canoe
-                    if game_state.board.is_on_grid(p):
-                        board_tensor[3][r][c] = 1
-                    if game_state.completes_canoe(p, current_player):
-                        board_tensor[4][r][c] = 1
-                    if game_state.completes_canoe(p, next_player):
-                        board_tensor[5][r][c] = 1
-                elif occupied == current_player:
-                    board_tensor[1][r][c] = 1
-                else:
-                    board_tensor[2][r][c] = 1
-        return board_tensor
-
-    def encode_point(self, point):
-        return self.board_width * (point.row - 1) + (point.col - 1)
-    
-    def decode_point_index(self, index):
-        r = index // self.board_width
-        c = index % self.board_width
-        return Point(row = r+1, col = c+1)
+        return self.encode_batch([game_state])[0]
+
+    def encode_batch(self, game_states, dtype=None):
+        reds, yellows, yellow_to_move = stack_pegs(game_states)
+        mine = np.where(yellow_to_move[:, None], yellows, reds)
+        theirs = np.where(yellow_to_move[:, None], reds, yellows)
+        empty = ~(reds | yellows)
+        n = len(game_states)
+        board_tensors = np.zeros((n, self.num_planes, NUM_POINTS), dtype=dtype or self.dtype)
+        board_tensors[:, 0] = yellow_to_move[:, None]
+        board_tensors[:, 1] = mine
+        board_tensors[:, 2] = theirs
+        board_tensors[:, 3] = empty & ON_GRID
+        board_tensors[:, 4] = empty & completion_cells(mine)
+        board_tensors[:, 5] = empty & completion_cells(theirs)
+        return board_tensors.reshape((n,) + self.shape())
 
     def num_points(self):
         return self.board_width * self.board_height
@@ -167,7 +157,12 @@ class RelativeEncoder(Encoder):
         return (self.num_planes, self.board_height, self.board_width)
 
 
-# def get_encoder_by_name(name):
-#     module = importlib.import_module('.' + name)
-#     constructor = getattr(module, 'create') # missing create(): dlgo/encoders/simple.py
-#     return constructor()
\ No newline at end of file
+def get_encoder_by_name(name, **kwargs):
+    encoders = {
+        'oneplane': OnePlaneEncoder,
+        'sixplane': SixPlaneEncoder,
+        'relative': RelativeEncoder,
+    }
+    if name not in encoders:
+        raise ValueError(f"Unknown encoder: {name}")
+    return encoders[name](**kwargs)
@@ -0,0 +1,221 @@
+import time
+from collections import namedtuple
+
+from canoebot.board import PLAY_MOVES, mirror_bits, popcount
+from canoebot.geometry import CANOE_DISJOINT, CANOE_MASKS, CANOES_THROUGH, MIRROR_IDX, ON_GRID_IDX, ON_GRID_MASK
+from canoebot.search import SearchTimeout, place, position_bits, winning_cells
+
+__all__ = [
+    'EndgameSolver',
+    'Solution',
+]
+
+# Exact solver for positions with few open spaces. Positions are (mine, theirs, my_canoes,
+# their_canoes) bitboards as in canoebot.search. Scores are from the side to move: 0 for a
+# draw, WIN - n for a win whose last move is n plies from the root, -(WIN - n) for a loss.
+# The transposition table stores scores relative to its own position, so entries stay
+# valid for every later root and the table is kept across calls.
+#
+# As in GameState.is_over, a move that fills the last open space ends the game in a draw,
+# even when it completes a winning pair of canoes.
+
+WIN = 1000
+EXACT, LOWER, UPPER = 0, 1, -1
+
+# result is 1, 0 or -1 for the side to move; distance is the number of plies until the
+# game ends, counting the last move (0 for a draw).
+Solution = namedtuple('Solution', 'move result distance')
+
+
+def to_table(score, ply):
+    # Root-relative score at ply -> score relative to the position itself.
+    if score > 0:
+        return score + ply
+    if score < 0:
+        return score - ply
+    return 0
+
+
+def from_table(score, ply):
+    if score > 0:
+        return score - ply
+    if score < 0:
+        return score + ply
+    return 0
+
+
+def useful_canoes(mine, theirs, canoes, moves_left):
+    # The canoes that can still be part of a winning pair for the side owning `mine`: its
+    # completed canoes plus those free of `theirs` and at most moves_left pegs short,
+    # keeping only canoes with a disjoint partner in the same set.
+    potential = canoes
+    for k, mask in enumerate(CANOE_MASKS):
+        if not mask & theirs and popcount(mask & ~mine) <= moves_left:
+            potential |= 1 << k
+    useful = 0
+    bits = potential
+    while bits:
+        low = bits & -bits
+        k = low.bit_length() - 1
+        if CANOE_DISJOINT[k] & potential:
+            useful |= low
+        bits ^= low
+    return useful
+
+
+def canoe_cells(bits, canoes):
+    # (cells of the given canoes, cells that would complete one of them) for the side
+    # owning bits; completed canoes contribute no cells.
+    cells = threats = 0
+    while canoes:
+        low = canoes & -canoes
+        missing = CANOE_MASKS[low.bit_length() - 1] & ~bits
+        cells |= missing
+        if missing and not missing & (missing - 1):
+            threats |= missing
+        canoes ^= low
+    return cells, threats
+
+
+class EndgameSolver():
+    """Solves positions with at most max_open open spaces exactly.
+
+    Negamax with alpha-beta over a transposition table keyed by mirror-reduced bitboards.
+    Canoe-aware pruning: a node is a draw as soon as neither side has two disjoint canoes
+    it could still complete with the moves it has left; the opponent's single winning
+    threat forces the block, two of them lose; and open cells outside every canoe that
+    could still matter are interchangeable, so only one of them is searched.
+
+    Moves are ordered deterministically, so the same position always gets the same move.
+    The table is cleared once it holds more than max_entries positions.
+    """
+    def __init__(self, max_open=12, max_entries=2000000, check_every=256):
+        self.max_open = max_open
+        self.max_entries = max_entries
+        self.check_every = check_every
+        self.nodes = 0
+        self.solved = 0
+        self.timeouts = 0
+        self._table = {}
+        self._deadline = None
+
+    def solve(self, game_state, deadline=None):
+        """Returns a Solution for the side to move, or None above max_open open spaces, once
+        the game is over, or when the solve runs past deadline (a time.monotonic value).
+        Positions solved before a timeout stay in the table."""
+        if game_state.board.open_spaces > self.max_open or game_state.is_over():
+            return None
+        mine, theirs, my_canoes, their_canoes = position_bits(game_state)
+        if len(self._table) > self.max_entries:
+            self._table = {}
+        self.nodes = 0
+        self._deadline = deadline
+        try:
+            score = self._negamax(mine, theirs, my_canoes, their_canoes, -WIN, WIN, 0)
+        except SearchTimeout:
+            self.timeouts += 1
+            return None
+        self.solved += 1
+        key, is_mirrored = self._key(mine, theirs)
+        entry = self._table.get(key)
+        if entry is None:
+            # One open space left: the only move, a draw.
+            empty = ON_GRID_MASK & ~(mine | theirs)
+            move = PLAY_MOVES[(empty & -empty).bit_length() - 1]
+        else:
+            move = PLAY_MOVES[MIRROR_IDX[entry[2]] if is_mirrored else entry[2]]
+        if score > 0:
+            return Solution(move, 1, WIN - score)
+        if score < 0:
+            return Solution(move, -1, WIN + score)
+        return Solution(move, 0, 0)
+
+    def select_move(self, game_state, deadline=None):
+        # The solved best move, or None when game_state is outside the endgame.
+        solution = self.solve(game_state, deadline)
+        return solution.move if solution is not None else None
+
+    def stats(self):
+        return {'max_open': self.max_open, 'solved': self.solved, 'timeouts': self.timeouts,
+                'table_size': len(self._table)}
+
+    @staticmethod
+    def _key(mine, theirs):
+        mirrored = (mirror_bits(mine), mirror_bits(theirs))
+        return (mirrored, True) if mirrored < (mine, theirs) else ((mine, theirs), False)
+
+    def _negamax(self, mine, theirs, my_canoes, their_canoes, alpha, beta, ply):
+        self.nodes += 1
+        if self._deadline is not None and self.nodes % self.check_every == 0 and time.monotonic() > self._deadline:
+            raise SearchTimeout()
+        empty = ON_GRID_MASK & ~(mine | theirs)
+        open_spaces = popcount(empty)
+        # Whatever is played into the last open space, the game ends in a draw.
+        if open_spaces <= 1:
+            return 0
+
+        key, is_mirrored = self._key(mine, theirs)
+        entry = self._table.get(key)
+        first = None
+        if entry is not None:
+            flag, value, best = entry
+            value = from_table(value, ply)
+            if flag == EXACT or (flag == LOWER and value >= beta) or (flag == UPPER and value <= alpha):
+                return value
+            first = MIRROR_IDX[best] if is_mirrored else best
+
+        my_moves, their_moves = (open_spaces + 1) // 2, open_spaces // 2
+        my_useful = useful_canoes(mine, theirs, my_canoes, my_moves)
+        their_useful = useful_canoes(theirs, mine, their_canoes, their_moves)
+        if not my_useful and not their_useful:
+            self._store(key, is_mirrored, EXACT, 0, ply, first if first is not None else (empty & -empty).bit_length() - 1)
+            return 0
+        my_cells, my_threats = canoe_cells(mine, my_useful)
+        their_cells, their_threats = canoe_cells(theirs, their_useful)
+
+        wins = winning_cells(mine, my_canoes, my_threats) if my_threats else []
+        if wins:
+            self._store(key, is_mirrored, EXACT, WIN - ply - 1, ply, wins[0])
+            return WIN - ply - 1
+        # Their win has to leave an open space behind, so needs two more after our move.
+        blocks = winning_cells(theirs, their_canoes, their_threats) if their_threats and open_spaces > 2 else []
+        if len(blocks) > 1:
+            self._store(key, is_mirrored, EXACT, -(WIN - ply - 2), ply, blocks[0])
+            return -(WIN - ply - 2)
+
+        if blocks:
+            moves = blocks
+        else:
+            moves = self._moves(empty, my_cells | their_cells, my_useful | their_useful, first)
+
+        original_alpha = alpha
+        best_score, best_idx = -WIN, moves[0]
+        for idx in moves:
+            child_mine, child_canoes, _ = place(mine, my_canoes, idx)
+            score = -self._negamax(theirs, child_mine, their_canoes, child_canoes, -beta, -alpha, ply + 1)
+            if score > best_score:
+                best_score, best_idx = score, idx
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                break
+        flag = UPPER if best_score <= original_alpha else (LOWER if best_score >= beta else EXACT)
+        self._store(key, is_mirrored, flag, best_score, ply, best_idx)
+        return best_score
+
+    def _store(self, key, is_mirrored, flag, score, ply, best):
+        self._table[key] = (flag, to_table(score, ply), MIRROR_IDX[best] if is_mirrored else best)
+
+    @staticmethod
+    def _moves(empty, relevant, useful, first):
+        # Open cells in a canoe that still matters, busiest first, then a single one of
+        # the rest: those are interchangeable, each only passes the turn.
+        weights = {}
+        for idx in ON_GRID_IDX:
+            if relevant >> idx & 1:
+                weights[idx] = sum(useful >> k & 1 for k in CANOES_THROUGH[idx])
+        moves = sorted(weights, key=lambda idx: (idx != first, -weights[idx], idx))
+        rest = empty & ~relevant
+        if rest:
+            moves.append((rest & -rest).bit_length() - 1)
+        return moves
@@ -1,5 +1,7 @@
 import numpy as np
 
+FIELDS = ('states', 'actions', 'rewards', 'advantages')
+
 class ExperienceBuffer:
     def __init__(self, states, actions, rewards, advantages):
         self.states = states
@@ -14,16 +16,108 @@ class ExperienceBuffer:
         h5file['experience'].create_dataset('rewards', data=self.rewards)
         h5file['experience'].create_dataset('advantages', data=self.advantages)
 
+class GrowableArray(object):
+    # A numpy array that can be appended to along its first axis, doubling its capacity
+    # when full. The row shape and dtype are taken from the first rows appended unless given.
+    def __init__(self, row_shape=None, dtype=None, capacity=256):
+        self.row_shape = row_shape
+        self.dtype = dtype
+        self.capacity = capacity
+        self.size = 0
+        self._data = None
+
+    def extend(self, rows):
+        rows = np.asarray(rows)
+        if self._data is None:
+            if self.row_shape is None:
+                self.row_shape = rows.shape[1:]
+            if self.dtype is None:
+                self.dtype = rows.dtype
+            self._data = np.empty((max(self.capacity, len(rows)),) + tuple(self.row_shape), dtype=self.dtype)
+        needed = self.size + len(rows)
+        if needed > len(self._data):
+            grown = np.empty((max(needed, 2 * len(self._data)),) + self._data.shape[1:], dtype=self.dtype)
+            grown[:self.size] = self._data[:self.size]
+            self._data = grown
+        self._data[self.size:needed] = rows
+        self.size = needed
+
+    def view(self):
+        if self._data is None:
+            return np.zeros((0,) + tuple(self.row_shape or ()), dtype=self.dtype or np.float64)
+        return self._data[:self.size]
+
+    def clear(self):
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+class ExperienceWriter(object):
+    # Appends experience to resizable, chunked and compressed datasets in h5file['experience'],
+    # the layout ExperienceBuffer.serialize and load_experience use.
+    def __init__(self, h5file, chunk_size=4096, compression='gzip'):
+        self.h5file = h5file
+        self.chunk_size = chunk_size
+        self.compression = compression
+        self.size = 0
+
+    def append(self, states, actions, rewards, advantages):
+        arrays = dict(zip(FIELDS, (states, actions, rewards, advantages)))
+        n = len(actions)
+        if n == 0:
+            return
+        if 'experience' not in self.h5file:
+            group = self.h5file.create_group('experience')
+            for name, array in arrays.items():
+                group.create_dataset(
+                    name, shape=(0,) + array.shape[1:], dtype=array.dtype,
+                    maxshape=(None,) + array.shape[1:],
+                    chunks=(self.chunk_size,) + array.shape[1:],
+                    compression=self.compression)
+        group = self.h5file['experience']
+        self.size = group['actions'].shape[0]
+        for name, array in arrays.items():
+            dataset = group[name]
+            dataset.resize(self.size + n, axis=0)
+            dataset[self.size:] = array
+        self.size += n
+
 class ExperienceCollector(object):
-    def __init__(self):
-        self.states = []
-        self.actions = []
-        self.rewards = []
-        self.advantages = []
+    # Decisions of the episode in progress are kept in small lists; completed episodes are
+    # copied into typed growable arrays. With a writer, completed episodes are written out
+    # whenever flush_size decisions have accumulated, so states/actions/rewards/advantages
+    # then only hold the decisions not yet flushed.
+    def __init__(self, writer=None, flush_size=4096, state_dtype=None):
+        self.writer = writer
+        self.flush_size = flush_size
+        self._states = GrowableArray(dtype=state_dtype)
+        self._actions = GrowableArray(row_shape=(), dtype=np.int32)
+        self._rewards = GrowableArray(row_shape=(), dtype=np.float32)
+        self._advantages = GrowableArray(row_shape=(), dtype=np.float32)
         self._current_episode_states = []
         self._current_episode_actions = []
         self._current_episode_estimated_values = []
 
+    @property
+    def states(self):
+        return self._states.view()
+
+    @property
+    def actions(self):
+        return self._actions.view()
+
+    @property
+    def rewards(self):
+        return self._rewards.view()
+
+    @property
+    def advantages(self):
+        return self._advantages.view()
+
+    def __len__(self):
+        return len(self._actions)
+
     def begin_episode(self):
         self._current_episode_states = []
         self._current_episode_actions = []
@@ -36,24 +130,48 @@ class ExperienceCollector(object):
 
     def complete_episode(self, reward):
         num_states = len(self._current_episode_states)
-        self.states += self._current_episode_states
-        self.actions += self._current_episode_actions
-        self.rewards += [reward for _ in range(num_states)]
-
-        for i in range(num_states):
-            advantage = reward - self._current_episode_estimated_values[i]
-            self.advantages.append(advantage)
+        if num_states > 0:
+            estimated_values = np.array([float(v) for v in self._current_episode_estimated_values], dtype=np.float32)
+            self._states.extend(np.stack(self._current_episode_states))
+            self._actions.extend(self._current_episode_actions)
+            self._rewards.extend(np.full(num_states, reward, dtype=np.float32))
+            self._advantages.extend(reward - estimated_values)
 
         self._current_episode_states = []
         self._current_episode_actions = []
         self._current_episode_estimated_values = []
+        if self.writer is not None and len(self) >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        if self.writer is None:
+            return
+        self.writer.append(self.states, self.actions, self.rewards, self.advantages)
+        for array in (self._states, self._actions, self._rewards, self._advantages):
+            array.clear()
+
+    def to_buffer(self):
+        # A copy: the collector's arrays are overwritten by later episodes after a flush.
+        return ExperienceBuffer(self.states.copy(), self.actions.copy(), self.rewards.copy(), self.advantages.copy())
 
 def combine_experience(collectors):
-    combined_states = np.concatenate([np.array(c.states) for c in collectors])
-    combined_actions = np.concatenate([np.array(c.actions) for c in collectors])
-    combined_rewards = np.concatenate([np.array(c.rewards) for c in collectors])
-    combined_advantages = np.concatenate([np.array(c.advantages) for c in collectors])
-    return ExperienceBuffer(combined_states, combined_actions, combined_rewards, combined_advantages)
+    # Accepts collectors or ExperienceBuffers. Preallocates each combined array and copies
+    # the inputs in, instead of materializing an intermediate array per collector. With no
+    # experience at all, the arrays are empty.
+    collectors = list(collectors)
+    shapes_from = [ c for c in collectors if len(c.actions) > 0 ] or collectors
+    collectors = [ c for c in collectors if len(c.actions) > 0 ]
+    total = sum(len(c.actions) for c in collectors)
+    combined = {}
+    for name in FIELDS:
+        first = np.asarray(getattr(shapes_from[0], name)) if shapes_from else np.zeros(0)
+        combined[name] = np.empty((total,) + first.shape[1:], dtype=first.dtype)
+        offset = 0
+        for c in collectors:
+            array = getattr(c, name)
+            combined[name][offset:offset + len(array)] = array
+            offset += len(array)
+    return ExperienceBuffer(**combined)
 
 def load_experience(h5file):
     return ExperienceBuffer(
@@ -61,3 +179,33 @@ def load_experience(h5file):
         actions = np.array(h5file['experience']['actions']),
         rewards = np.array(h5file['experience']['rewards']),
         advantages = np.array(h5file['experience']['advantages']))
+
+class ExperienceReader(object):
+    # Reads experience from h5file['experience'] a slice at a time instead of loading the
+    # datasets whole. Contiguous, chunk-aligned slices are the cheap reads for chunked
+    # datasets, so shuffled batches draw whole blocks in random order and shuffle rows
+    # within each block.
+    def __init__(self, h5file):
+        self.group = h5file['experience']
+
+    def __len__(self):
+        return self.group['actions'].shape[0]
+
+    def read(self, start, stop):
+        return ExperienceBuffer(**{ name: self.group[name][start:stop] for name in FIELDS })
+
+    def batches(self, batch_size, shuffle=False, block_size=None):
+        n = len(self)
+        if not shuffle:
+            for start in range(0, n, batch_size):
+                yield self.read(start, min(start + batch_size, n))
+            return
+        if block_size is None:
+            chunks = self.group['actions'].chunks
+            block_size = max(batch_size, chunks[0] if chunks else batch_size)
+        for start in np.random.permutation(np.arange(0, n, block_size)):
+            block = self.read(start, min(start + block_size, n))
+            order = np.random.permutation(len(block.actions))
+            for i in range(0, len(order), batch_size):
+                rows = order[i:i + batch_size]
+                yield ExperienceBuffer(**{ name: getattr(block, name)[rows] for name in FIELDS })
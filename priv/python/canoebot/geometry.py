@@ -0,0 +1,93 @@
+from collections import namedtuple
+
+import numpy as np
+
+# Static tables describing the board: its cells, which are on the grid, their
+# neighborhoods, the left-right mirror and every canoe shape. Cells are indexed
+# 13 * (row - 1) + (col - 1), rows 1..6 and columns 1..13. Everything here is built
+# once at import and never changes; canoebot.board re-exports it.
+
+
+class Point(namedtuple('Point', 'row col')):
+    def neighbors(self):
+        return [
+            Point(self.row - 1, self.col),
+            Point(self.row + 1, self.col),
+            Point(self.row, self.col - 1),
+            Point(self.row, self.col + 1)
+        ]
+
+    def to_idx(self):
+        # Encoders decode numpy integers into Points; bitboard shifts need a plain int.
+        return int(13 * (self.row - 1) + (self.col - 1))
+
+NUM_ROWS = 6
+NUM_COLS = 13
+NUM_POINTS = NUM_ROWS * NUM_COLS
+OFF_GRID = (0, 3, 4, 5, 6, 7, 8, 9, 12, 52, 64, 65, 66, 67, 75, 76, 77)
+ON_GRID_IDX = tuple(idx for idx in range(NUM_POINTS) if idx not in OFF_GRID)
+ON_GRID_MASK = sum(1 << idx for idx in ON_GRID_IDX)
+ON_GRID = np.zeros(NUM_POINTS, dtype=bool)
+ON_GRID[list(ON_GRID_IDX)] = True
+
+# One shared Point per index so hot paths don't allocate them.
+POINTS = tuple(Point(idx // NUM_COLS + 1, idx % NUM_COLS + 1) for idx in range(NUM_POINTS))
+
+def point_from_idx(idx):
+    return POINTS[idx]
+
+def _on_grid(r, c):
+    return 1 <= r <= NUM_ROWS and 1 <= c <= NUM_COLS and Point(r, c).to_idx() not in OFF_GRID
+
+# NEIGHBORHOODS[idx] lists the on-grid cells of the 3x3 block centred on idx (idx
+# included), row by row; NEIGHBORHOOD_MASKS[idx] is the same set as a bitboard.
+NEIGHBORHOODS = tuple(
+    tuple(Point(r, c).to_idx() for r in (p.row - 1, p.row, p.row + 1) for c in (p.col - 1, p.col, p.col + 1)
+          if _on_grid(r, c))
+    for p in POINTS)
+NEIGHBORHOOD_MASKS = tuple(sum(1 << idx for idx in cells) for cells in NEIGHBORHOODS)
+
+# The board is left-right symmetric: MIRROR_IDX[idx] is the cell idx maps to when the
+# columns are reversed. It is its own inverse, and it maps canoes in solns onto canoes.
+MIRROR_IDX = tuple(NUM_COLS * (idx // NUM_COLS) + (NUM_COLS - 1 - idx % NUM_COLS) for idx in range(NUM_POINTS))
+# The same map as an index array, to remap policies or action arrays in one step.
+MIRROR_PERMUTATION = np.array(MIRROR_IDX)
+
+def _canoe_shapes(r, c):
+    return (
+        ((r, c), (r, c+3), (r+1, c+1), (r+1, c+2)),   # \__/
+        ((r, c+1), (r, c+2), (r+1, c), (r+1, c+3)),   # /~~\
+        ((r, c+1), (r+1, c), (r+2, c), (r+3, c+1)),   # (
+        ((r, c), (r+1, c+1), (r+2, c+1), (r+3, c)),   # )
+    )
+
+solns = []
+for shape in range(4):
+    for r in range(1, NUM_ROWS):
+        for c in range(1, NUM_COLS):
+            cells = _canoe_shapes(r, c)[shape]
+            if all(_on_grid(*cell) for cell in cells):
+                solns.append(tuple(Point(*cell).to_idx() for cell in cells))
+
+# CANOE_MASKS[i] is the bitboard of solns[i]; COMPLETION_MASKS[idx] holds, for every
+# canoe through idx, the mask of its other three cells (the same canoes as solns_dict[idx]).
+CANOE_MASKS = [ sum(1 << idx for idx in soln) for soln in solns ]
+solns_dict = { idx: [] for idx in range(NUM_POINTS) }
+COMPLETION_MASKS = [ [] for _ in range(NUM_POINTS) ]
+for soln, mask in zip(solns, CANOE_MASKS):
+    for idx in soln:
+        solns_dict[idx].append(tuple(el for el in soln if el != idx))
+        COMPLETION_MASKS[idx].append(mask & ~(1 << idx))
+
+# Canoe-level tables, indexed like solns: CANOES_THROUGH[idx] lists the canoes containing
+# idx, and bit j of CANOE_DISJOINT[k] is set when canoes k and j share no cell, i.e. when
+# completing both wins the game.
+CANOES_THROUGH = [ [ k for k, soln in enumerate(solns) if idx in soln ] for idx in range(NUM_POINTS) ]
+CANOE_DISJOINT = [ sum(1 << j for j, other in enumerate(CANOE_MASKS) if not mask & other) for mask in CANOE_MASKS ]
+# CANOE_BITS_THROUGH[idx] is CANOES_THROUGH[idx] as a bitset.
+CANOE_BITS_THROUGH = [ sum(1 << k for k in canoes) for canoes in CANOES_THROUGH ]
+
+# CANOE_INCIDENCE[idx, k] is 1 when cell idx belongs to canoe solns[k].
+CANOE_INCIDENCE = np.zeros((NUM_POINTS, len(solns)), dtype=np.float32)
+for k, soln in enumerate(solns):
+    CANOE_INCIDENCE[list(soln), k] = 1
@@ -0,0 +1,203 @@
+import math
+import time
+
+import numpy as np
+
+from canoebot.board import Board, GameState, Player
+from canoebot.geometry import NUM_POINTS, ON_GRID_MASK
+from canoebot.search import place
+
+__all__ = [
+    'MCTS',
+]
+
+
+class Node():
+    # A position plus the statistics of the edges leading out of it. Edge arrays are
+    # indexed like `moves`; children are created lazily the first time an edge is taken.
+    __slots__ = ('red_bits', 'yellow_bits', 'red_canoes', 'yellow_canoes', 'player',
+                 'terminal_value', 'moves', 'priors', 'clean_priors', 'visits', 'value_sums', 'children', 'value')
+
+    def __init__(self, red_bits, yellow_bits, red_canoes, yellow_canoes, player, terminal_value=None):
+        self.red_bits = red_bits
+        self.yellow_bits = yellow_bits
+        self.red_canoes = red_canoes
+        self.yellow_canoes = yellow_canoes
+        self.player = player
+        # Set for finished games: the result for the player to move (-1 lost, 0 draw).
+        self.terminal_value = terminal_value
+        self.moves = None
+        self.priors = None
+        # The network's priors; priors differs from them only at a root with Dirichlet noise.
+        self.clean_priors = None
+        self.visits = None
+        self.value_sums = None
+        self.children = None
+        self.value = 0.0
+
+    @property
+    def is_expanded(self):
+        return self.moves is not None
+
+    def game_state(self):
+        board = Board()
+        board.red_bits = self.red_bits
+        board.yellow_bits = self.yellow_bits
+        return GameState(board, self.player, None, None)
+
+    def child(self, i):
+        if self.children[i] is None:
+            idx = int(self.moves[i])
+            if self.player == Player.red:
+                red_bits, red_canoes, won = place(self.red_bits, self.red_canoes, idx)
+                yellow_bits, yellow_canoes = self.yellow_bits, self.yellow_canoes
+            else:
+                yellow_bits, yellow_canoes, won = place(self.yellow_bits, self.yellow_canoes, idx)
+                red_bits, red_canoes = self.red_bits, self.red_canoes
+            # As in GameState.is_over, filling the last open space is a draw even when it
+            # completes a winning pair.
+            terminal_value = None
+            if not ON_GRID_MASK & ~(red_bits | yellow_bits):
+                terminal_value = 0.0
+            elif won:
+                terminal_value = -1.0
+            self.children[i] = Node(red_bits, yellow_bits, red_canoes, yellow_canoes, self.player.other, terminal_value)
+        return self.children[i]
+
+    def expand(self, policy, value):
+        occupied = self.red_bits | self.yellow_bits
+        self.moves = np.array([ idx for idx in range(NUM_POINTS) if ON_GRID_MASK >> idx & 1 and not occupied >> idx & 1 ])
+        priors = np.asarray(policy, dtype=np.float64)[self.moves]
+        total = priors.sum()
+        self.priors = priors / total if total > 0 else np.full(len(self.moves), 1.0 / len(self.moves))
+        self.clean_priors = self.priors
+        self.visits = np.zeros(len(self.moves))
+        self.value_sums = np.zeros(len(self.moves))
+        self.children = [None] * len(self.moves)
+        self.value = float(value)
+
+
+class MCTS():
+    """PUCT tree search guided by an ACAgent's policy (priors) and value (leaf evaluation).
+
+    Each round selects up to batch_size leaves, applying a virtual loss along every
+    selected path so the next selection in the same round explores elsewhere. All leaves
+    of a round are evaluated in one agent.evaluate call. Values are from the point of
+    view of the player to move, like the ACAgent value head.
+    """
+    def __init__(self, agent, num_simulations=200, time_budget=None, batch_size=16,
+                 c_puct=1.5, virtual_loss=1.0, dirichlet_alpha=None, dirichlet_weight=0.25):
+        self.agent = agent
+        self.num_simulations = num_simulations
+        self.time_budget = time_budget
+        self.batch_size = batch_size
+        self.c_puct = c_puct
+        self.virtual_loss = virtual_loss
+        self.dirichlet_alpha = dirichlet_alpha
+        self.dirichlet_weight = dirichlet_weight
+        self.root = None
+        self.num_batches = 0
+
+    def set_root(self, game_state):
+        # Reuses the subtree for game_state if it is the current root, one of its children
+        # (after advance() the root is our move, so the opponent's reply is a child) or a
+        # grandchild (our move and the reply, when the tree wasn't advanced).
+        reds, yellows = game_state.board.red_bits, game_state.board.yellow_bits
+        key = (reds, yellows, game_state.current_player)
+        root = self.root
+        candidates = [root] if root is not None else []
+        if root is not None and root.is_expanded:
+            children = [ c for c in root.children if c is not None ]
+            candidates.extend(children)
+            for child in children:
+                if child.is_expanded:
+                    candidates.extend(c for c in child.children if c is not None)
+        for node in candidates:
+            if (node.red_bits, node.yellow_bits, node.player) == key:
+                self.root = node
+                return node
+        self.root = Node(reds, yellows, game_state.completed_canoes(Player.red),
+                         game_state.completed_canoes(Player.yellow), game_state.current_player)
+        return self.root
+
+    def advance(self, i):
+        # Keeps the subtree below the chosen root edge for the next search.
+        self.root = self.root.child(i)
+
+    def run(self, game_state):
+        root = self.set_root(game_state)
+        if root.terminal_value is not None:
+            return root
+        if not root.is_expanded:
+            self._evaluate([root])
+        if self.dirichlet_alpha is not None:
+            noise = np.random.dirichlet([self.dirichlet_alpha] * len(root.moves))
+            # Mixed into the clean priors, so a root reused across searches gets fresh noise
+            # rather than accumulating it.
+            root.priors = (1 - self.dirichlet_weight) * root.clean_priors + self.dirichlet_weight * noise
+
+        deadline = time.monotonic() + self.time_budget if self.time_budget is not None else None
+        simulations = 0
+        while simulations < self.num_simulations:
+            if deadline is not None and time.monotonic() > deadline:
+                break
+            simulations += self._round(root, min(self.batch_size, self.num_simulations - simulations))
+        return root
+
+    def _select(self, node):
+        counts = node.visits
+        q = np.divide(node.value_sums, counts, out=np.zeros_like(counts), where=counts > 0)
+        u = self.c_puct * node.priors * math.sqrt(counts.sum() + 1) / (1 + counts)
+        return int(np.argmax(q + u))
+
+    def _round(self, root, batch_size):
+        leaves = []
+        paths = []
+        finished = 0
+        for _ in range(batch_size):
+            node, path = root, []
+            while node.is_expanded and node.terminal_value is None:
+                i = self._select(node)
+                path.append((node, i))
+                node.visits[i] += self.virtual_loss
+                node.value_sums[i] -= self.virtual_loss
+                node = node.child(i)
+            if node.terminal_value is not None:
+                self._undo_virtual_loss(path)
+                self._backup(path, node.terminal_value)
+                finished += 1
+            elif any(node is leaf for leaf in leaves):
+                # Another path in this round already reached this leaf; the virtual loss
+                # didn't divert the search, so evaluate what we have.
+                self._undo_virtual_loss(path)
+                break
+            else:
+                leaves.append(node)
+                paths.append(path)
+        if leaves:
+            self._evaluate(leaves)
+            for leaf, path in zip(leaves, paths):
+                self._undo_virtual_loss(path)
+                self._backup(path, leaf.value)
+        return max(1, finished + len(leaves))
+
+    def _evaluate(self, nodes):
+        games = [ node.game_state() for node in nodes ]
+        board_tensors = self.agent.encoder.encode_batch(games)
+        policies, values = self.agent.evaluate(games, board_tensors)
+        self.num_batches += 1
+        for node, policy, value in zip(nodes, policies, values):
+            node.expand(policy, value)
+
+    def _undo_virtual_loss(self, path):
+        for node, i in path:
+            node.visits[i] -= self.virtual_loss
+            node.value_sums[i] += self.virtual_loss
+
+    def _backup(self, path, value):
+        # value is for the player to move at the end of the path; each edge is scored for
+        # the player who took it.
+        for node, i in reversed(path):
+            value = -value
+            node.visits[i] += 1
+            node.value_sums[i] += value
@@ -0,0 +1,185 @@
+import json
+
+import numpy as np
+
+__all__ = [
+    'NumpyModel',
+]
+
+# Forward-pass-only stand-in for the small Keras models in generated_models/. A model is
+# exported with canoebot.utils.export_numpy_model into an .npz file holding every layer's
+# weights plus a JSON description of the layer graph; NumpyModel replays that graph with
+# numpy so inference needs neither TensorFlow nor its per-call dispatch overhead.
+
+
+def _activation(name):
+    if name in (None, 'linear'):
+        return lambda x: x
+    if name == 'relu':
+        return lambda x: np.maximum(x, 0)
+    if name == 'tanh':
+        return np.tanh
+    if name == 'sigmoid':
+        return lambda x: 1 / (1 + np.exp(-x))
+    if name == 'softmax':
+        def softmax(x):
+            e = np.exp(x - np.max(x, axis=-1, keepdims=True))
+            return e / np.sum(e, axis=-1, keepdims=True)
+        return softmax
+    raise ValueError(f'Unsupported activation: {name}')
+
+
+def _conv2d(x, kernel, strides, padding):
+    # x is (N, H, W, C_in), kernel is (kh, kw, C_in, C_out).
+    kh, kw = kernel.shape[:2]
+    if padding == 'same':
+        # As TensorFlow pads: ceil(size / stride) outputs, the odd pixel on the bottom/right.
+        pads = []
+        for size, k, stride in zip(x.shape[1:3], (kh, kw), strides):
+            total = max((-(-size // stride) - 1) * stride + k - size, 0)
+            pads.append((total // 2, total - total // 2))
+        x = np.pad(x, ((0, 0), pads[0], pads[1], (0, 0)))
+    elif padding != 'valid':
+        raise ValueError(f'Unsupported padding: {padding}')
+    windows = np.lib.stride_tricks.sliding_window_view(x, (kh, kw), axis=(1, 2))
+    windows = windows[:, ::strides[0], ::strides[1]]
+    # windows is (N, H', W', C_in, kh, kw)
+    return np.einsum('nhwcij,ijco->nhwo', windows, kernel, optimize=True)
+
+
+def _channels_last(x, data_format):
+    return np.moveaxis(x, 1, -1) if data_format == 'channels_first' else x
+
+
+def _restore_format(x, data_format):
+    return np.moveaxis(x, -1, 1) if data_format == 'channels_first' else x
+
+
+class _Layer():
+    def __init__(self, class_name, config, weights):
+        self.class_name = class_name
+        self.config = config
+        self.weights = [ w.astype(np.float32) for w in weights ]
+        if not hasattr(self, '_' + class_name):
+            raise ValueError(f'Unsupported layer type: {class_name}')
+        self.call = getattr(self, '_' + class_name)
+
+    def _InputLayer(self, x):
+        return x
+
+    def _Dropout(self, x):
+        return x
+
+    def _Activation(self, x):
+        return _activation(self.config['activation'])(x)
+
+    def _Dense(self, x):
+        y = x @ self.weights[0]
+        if self.config.get('use_bias', True):
+            y = y + self.weights[1]
+        return _activation(self.config.get('activation'))(y)
+
+    def _Conv2D(self, x):
+        if tuple(self.config.get('dilation_rate', (1, 1))) != (1, 1):
+            raise ValueError('Dilated convolutions are not supported')
+        data_format = self.config.get('data_format', 'channels_last')
+        y = _conv2d(_channels_last(x, data_format), self.weights[0],
+                    self.config.get('strides', (1, 1)), self.config.get('padding', 'valid'))
+        if self.config.get('use_bias', True):
+            y = y + self.weights[1]
+        y = _activation(self.config.get('activation'))(y)
+        return _restore_format(y, data_format)
+
+    def _ZeroPadding2D(self, x):
+        (top, bottom), (left, right) = self.config['padding']
+        data_format = self.config.get('data_format', 'channels_last')
+        y = np.pad(_channels_last(x, data_format), ((0, 0), (top, bottom), (left, right), (0, 0)))
+        return _restore_format(y, data_format)
+
+    def _BatchNormalization(self, x):
+        weights = list(self.weights)
+        gamma = weights.pop(0) if self.config.get('scale', True) else 1
+        beta = weights.pop(0) if self.config.get('center', True) else 0
+        mean, variance = weights
+        axis = self.config.get('axis', -1)
+        axis = axis[0] if isinstance(axis, (list, tuple)) else axis
+        shape = [1] * x.ndim
+        shape[axis] = x.shape[axis]
+        scale = (gamma / np.sqrt(variance + self.config.get('epsilon', 1e-3))).reshape(shape)
+        offset = (beta - mean * gamma / np.sqrt(variance + self.config.get('epsilon', 1e-3))).reshape(shape)
+        return x * scale + offset
+
+    def _Flatten(self, x):
+        x = _channels_last(x, self.config.get('data_format', 'channels_last'))
+        return x.reshape(x.shape[0], -1)
+
+    def _Reshape(self, x):
+        return x.reshape((x.shape[0],) + tuple(self.config['target_shape']))
+
+    def _Concatenate(self, *xs):
+        return np.concatenate(xs, axis=self.config.get('axis', -1))
+
+    def _Add(self, *xs):
+        return sum(xs[1:], xs[0])
+
+
+class NumpyModel():
+    def __init__(self, graph, weights):
+        self.name = graph.get('name')
+        self.input_names = graph['inputs']
+        self.output_names = graph['outputs']
+        self.nodes = [
+            (node['name'], node['inbound'], _Layer(node['class_name'], node['config'], weights[node['name']]))
+            for node in graph['layers']
+        ]
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as f:
+            graph = json.loads(str(f['__graph__']))
+            weights = { node['name']: [ f[f"{node['name']}/{i}"] for i in range(node['num_weights']) ]
+                        for node in graph['layers'] }
+        return cls(graph, weights)
+
+    def __call__(self, inputs):
+        if not isinstance(inputs, (list, tuple)):
+            inputs = [inputs]
+        values = { name: np.asarray(x, dtype=np.float32) for name, x in zip(self.input_names, inputs) }
+        for name, inbound, layer in self.nodes:
+            if name in values:
+                continue
+            values[name] = layer.call(*[ values[i] for i in inbound ])
+        outputs = [ values[name] for name in self.output_names ]
+        return outputs if len(outputs) > 1 else outputs[0]
+
+    def predict(self, inputs, **kwargs):
+        return self(inputs)
+
+
+def main():
+    # python -m canoebot.numpy_model ac-v12: export generated_models/ac-v12.h5 to ac-v12.npz
+    # and check the numpy forward pass against Keras on encoded random-play positions.
+    import argparse
+    from canoebot import utils
+    from canoebot.board import GameState
+    from canoebot.encoders import RelativeEncoder
+    parser = argparse.ArgumentParser()
+    parser.add_argument('model_name')
+    parser.add_argument('--positions', type=int, default=256)
+    args = parser.parse_args()
+
+    utils.export_numpy_model(args.model_name)
+    games = []
+    while len(games) < args.positions:
+        game = GameState.new_game()
+        while not game.is_over() and len(games) < args.positions:
+            games.append(game)
+            moves = game.legal_moves()
+            game = game.apply_move(moves[np.random.choice(len(moves))])
+    inputs = RelativeEncoder(dtype=np.float32).encode_batch(games)
+    max_diff = utils.check_numpy_model(utils.load_model(args.model_name), utils.load_numpy_model(args.model_name), inputs)
+    print(f'Exported {args.model_name}.npz; max abs difference from Keras over {len(games)} positions: {max_diff:.3g}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+import io
+import os
+import re
+import threading
+
+from canoebot import utils
+
+__all__ = [
+    'ModelRegistry',
+    'model_id',
+]
+
+# Models in generated_models/ are named <name>-v<version>, e.g. ac-v12, and saved as
+# Keras .h5 files and/or .npz exports for NumpyModel (see utils.export_numpy_model).
+#
+# The files are build artifacts, not kept in git. Given a trained ac-v12.h5 (written by
+# canoebot.training or canoebot.selfplay with --out), run from priv/python:
+#   python -m canoebot.numpy_model ac-v12                      writes ac-v12.npz
+#   python -m canoebot.book ac-v12 --plies 8 --games 20000     writes ac-v12.book.npy
+
+
+def model_id(name, version=None):
+    return name if version is None else f'{name}-v{version}'
+
+
+class ModelRegistry():
+    """Loads models by name and version and keeps them for reuse.
+
+    A file is read into memory in one go and parsed from there: .npz through np.load on
+    a BytesIO, .h5 through an in-memory h5py file. A model being loaded never sees a
+    half-written file as long as new versions are written under a new name. With no
+    version, the highest version present is loaded; a name without versions (e.g.
+    "ac-v12" itself) is loaded as is.
+
+    backend is 'inference' (the .npz export if present, else the Keras model),
+    'numpy' or 'keras'.
+    """
+    def __init__(self, model_dir=None):
+        self.model_dir = model_dir or utils.MODEL_DIR
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def versions(self, name):
+        pattern = re.compile(re.escape(name) + r'-v(\d+)\.(?:h5|npz)$')
+        found = set()
+        for filename in os.listdir(self.model_dir):
+            match = pattern.match(filename)
+            if match:
+                found.add(int(match.group(1)))
+        return sorted(found)
+
+    def latest_version(self, name):
+        versions = self.versions(name)
+        return versions[-1] if versions else None
+
+    def resolve(self, name, version=None):
+        # The model id to load for name and version.
+        if version is None:
+            version = self.latest_version(name)
+        return model_id(name, version)
+
+    def path(self, name, version=None, extension='.h5'):
+        return os.path.join(self.model_dir, self.resolve(name, version) + extension)
+
+    def load(self, name, version=None, backend='inference'):
+        key = (self.resolve(name, version), backend)
+        with self._lock:
+            model = self._models.get(key)
+        if model is None:
+            # Loaded outside the lock, so other models stay available meanwhile; two
+            # threads racing for the same model both load it and the first one wins.
+            model = self._read(key[0], backend)
+            with self._lock:
+                model = self._models.setdefault(key, model)
+        return model
+
+    def _read(self, mid, backend):
+        base = os.path.join(self.model_dir, mid)
+        if backend in ('inference', 'numpy') and os.path.exists(base + '.npz'):
+            from canoebot.numpy_model import NumpyModel
+            with open(base + '.npz', 'rb') as f:
+                return NumpyModel.load(io.BytesIO(f.read()))
+        if backend == 'numpy':
+            raise FileNotFoundError(base + '.npz')
+        if backend not in ('inference', 'keras'):
+            raise ValueError(f'Unknown backend: {backend}')
+        with open(base + '.h5', 'rb') as f:
+            return utils.load_model_from_bytes(f.read())
+
+    def loaded(self):
+        with self._lock:
+            return sorted(self._models)
+
+    def evict(self, name, version=None):
+        mid = self.resolve(name, version)
+        with self._lock:
+            for key in [ key for key in self._models if key[0] == mid ]:
+                del self._models[key]
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
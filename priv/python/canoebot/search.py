@@ -0,0 +1,260 @@
+import time
+
+import numpy as np
+
+from canoebot.board import popcount
+from canoebot.geometry import CANOE_DISJOINT, CANOE_MASKS, CANOES_THROUGH, ON_GRID_IDX, ON_GRID_MASK
+
+__all__ = [
+    'Search',
+    'best_cell',
+    'position_bits',
+    'tactical_move',
+]
+
+# Game-tree search over bitboards. A position is (mine, theirs, my_canoes, their_canoes)
+# from the side to move's point of view: two peg bitboards plus, for each side, a bitset
+# over solns indices of the canoes it has completed. Ints are immutable, so making a move
+# is building the child's ints and unmaking it is just returning to the caller's.
+
+WIN_SCORE = 100000
+# Static evaluation weight of a canoe that only one side has pegs in, by its peg count.
+CANOE_WEIGHTS = (0, 1, 3, 9, 30)
+# Move ordering weight of an empty cell per live canoe through it, by that canoe's peg
+# count: the value the canoe would reach with a peg there (full canoes have no empty cells).
+CELL_WEIGHTS = CANOE_WEIGHTS[1:] + (0,)
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+def position_bits(game_state):
+    # (mine, theirs, my_canoes, their_canoes) for the player to move in game_state.
+    board = game_state.board
+    player = game_state.current_player
+    return (board.player_bits(player), board.player_bits(player.other),
+            game_state.completed_canoes(player), game_state.completed_canoes(player.other))
+
+
+def place(bits, canoes, idx):
+    # Adds a peg at idx; returns the new bitboard, the new completed-canoe set and whether
+    # that wins. Any new winning pair must include a canoe completed by this peg.
+    bits |= 1 << idx
+    new_canoes = 0
+    for k in CANOES_THROUGH[idx]:
+        mask = CANOE_MASKS[k]
+        if bits & mask == mask:
+            new_canoes |= 1 << k
+    if not new_canoes:
+        return bits, canoes, False
+    canoes |= new_canoes
+    won = False
+    for k in CANOES_THROUGH[idx]:
+        if new_canoes >> k & 1 and CANOE_DISJOINT[k] & canoes:
+            won = True
+            break
+    return bits, canoes, won
+
+
+def scan(mine, theirs):
+    # One pass over the canoes, returning (my_threats, their_threats, score). A side's
+    # threats are the cells that would complete one of its canoes (canoes missing exactly
+    # one, still empty, cell); score is the static evaluation for the side to move.
+    my_threats = their_threats = score = 0
+    for mask in CANOE_MASKS:
+        if not mask & theirs:
+            missing = mask & ~mine
+            if missing and not missing & (missing - 1):
+                my_threats |= missing
+            score += CANOE_WEIGHTS[popcount(mask & mine)]
+        elif not mask & mine:
+            missing = mask & ~theirs
+            if not missing & (missing - 1):
+                their_threats |= missing
+            score -= CANOE_WEIGHTS[popcount(mask & theirs)]
+    return my_threats, their_threats, score
+
+
+def winning_cells(bits, canoes, threats):
+    # The threat cells where placing a peg completes a winning pair of canoes.
+    cells = []
+    while threats:
+        low = threats & -threats
+        idx = low.bit_length() - 1
+        if place(bits, canoes, idx)[2]:
+            cells.append(idx)
+        threats ^= low
+    return cells
+
+
+def tactical_move(mine, theirs, my_canoes, their_canoes):
+    # (cell index, 'win' or 'block'): a cell winning at once, else one blocking an
+    # immediate win of the opponent; (None, None) when there is neither.
+    my_threats, their_threats, _ = scan(mine, theirs)
+    wins = winning_cells(mine, my_canoes, my_threats) if my_threats else []
+    if wins:
+        return wins[0], 'win'
+    blocks = winning_cells(theirs, their_canoes, their_threats) if their_threats else []
+    if blocks:
+        return blocks[0], 'block'
+    return None, None
+
+
+def best_cell(mine, theirs):
+    # The open cell with the highest cell_scores value: a static, instant move choice.
+    scores = cell_scores(mine, theirs)
+    empty = ON_GRID_MASK & ~(mine | theirs)
+    return max((idx for idx in ON_GRID_IDX if empty >> idx & 1), key=lambda idx: scores[idx], default=None)
+
+
+def cell_scores(mine, theirs):
+    # How much each empty cell is worth to either side, summed over the live canoes through it.
+    canoe_values = []
+    for mask in CANOE_MASKS:
+        if not mask & theirs:
+            canoe_values.append(CELL_WEIGHTS[popcount(mask & mine)])
+        elif not mask & mine:
+            canoe_values.append(CELL_WEIGHTS[popcount(mask & theirs)])
+        else:
+            canoe_values.append(0)
+    return [ sum(canoe_values[k] for k in CANOES_THROUGH[idx]) for idx in range(len(CANOES_THROUGH)) ]
+
+
+class Search():
+    """Iterative-deepening negamax with alpha-beta pruning and a transposition table.
+
+    Before branching, every node checks for an immediate win, and restricts the moves
+    to the single block when the opponent threatens one immediate win (or scores the
+    node as lost when it threatens two). The remaining moves are ordered: the
+    transposition table's best move, then cells completing one of our canoes, then cells
+    completing one of theirs, then the rest by the live canoes running through them.
+
+    With time_budget None (the default) every search completes max_depth; depth 3 takes
+    about 0.2 s a move on average, depth 4 up to a few seconds. A time budget stops the
+    deepening early and plays the best move of the last completed depth.
+    """
+    def __init__(self, max_depth=3, time_budget=None, check_every=16):
+        self.max_depth = max_depth
+        self.time_budget = time_budget
+        self.check_every = check_every
+        self.nodes = 0
+        self.depth_reached = 0
+        self._deadline = None
+        self._table = {}
+
+    def best_move(self, mine, theirs, my_canoes, their_canoes, deadline=None):
+        """Returns (cell index, score) for the side to move, or (None, 0) on a full board."""
+        self.nodes = 0
+        self.depth_reached = 0
+        self._table = {}
+        if deadline is None and self.time_budget is not None:
+            deadline = time.monotonic() + self.time_budget
+        self._deadline = deadline
+        empty = ON_GRID_MASK & ~(mine | theirs)
+        if not empty:
+            return None, 0
+        if not empty & (empty - 1):
+            # The last open space: a draw whatever it completes.
+            return empty.bit_length() - 1, 0
+
+        my_threats, their_threats, _ = scan(mine, theirs)
+        wins = winning_cells(mine, my_canoes, my_threats)
+        if wins:
+            return wins[0], WIN_SCORE
+        blocks = winning_cells(theirs, their_canoes, their_threats) if popcount(empty) > 2 else []
+        moves = [ idx for idx in ON_GRID_IDX if empty >> idx & 1 ]
+        if blocks:
+            # Block one threat; with two or more the game is lost either way.
+            return blocks[0], (-(WIN_SCORE - 1) if len(blocks) > 1 else 0)
+        # Shuffle first so that equally scored moves don't always resolve the same way.
+        moves = [ moves[i] for i in np.random.permutation(len(moves)) ]
+        moves = self._order(moves, mine, theirs, my_threats, their_threats, None)
+
+        best, best_score = moves[0], 0
+        for depth in range(1, self.max_depth + 1):
+            try:
+                scores = {}
+                alpha = -WIN_SCORE - 1
+                for idx in moves:
+                    child_mine, child_canoes, _ = place(mine, my_canoes, idx)
+                    score = -self._negamax(theirs, child_mine, their_canoes, child_canoes,
+                                           depth - 1, -WIN_SCORE - 1, -alpha, 1)
+                    scores[idx] = score
+                    if score > alpha:
+                        alpha = score
+            except SearchTimeout:
+                break
+            moves.sort(key=lambda idx: -scores[idx])
+            best, best_score = moves[0], scores[moves[0]]
+            self.depth_reached = depth
+            if abs(best_score) >= WIN_SCORE - self.max_depth - 2:
+                break
+        return best, best_score
+
+    def _order(self, moves, mine, theirs, my_threats, their_threats, first):
+        if len(moves) <= 1:
+            return moves
+        scores = cell_scores(mine, theirs)
+        def key(idx):
+            bit = 1 << idx
+            return (idx != first, not my_threats & bit, not their_threats & bit, -scores[idx])
+        return sorted(moves, key=key)
+
+    def _negamax(self, mine, theirs, my_canoes, their_canoes, depth, alpha, beta, ply):
+        self.nodes += 1
+        if self._deadline is not None and self.nodes % self.check_every == 0 and time.monotonic() > self._deadline:
+            raise SearchTimeout()
+        empty = ON_GRID_MASK & ~(mine | theirs)
+        # As in GameState.is_over, filling the last open space is a draw even when it
+        # completes a winning pair, so a win needs an open space left behind it.
+        if not empty & (empty - 1):
+            return 0
+        my_threats, their_threats, score = scan(mine, theirs)
+        if my_threats and winning_cells(mine, my_canoes, my_threats):
+            return WIN_SCORE - ply
+        blocks = winning_cells(theirs, their_canoes, their_threats) if their_threats and popcount(empty) > 2 else []
+        if len(blocks) > 1:
+            return -(WIN_SCORE - ply - 1)
+        if depth <= 0:
+            return score
+
+        key = (mine, theirs)
+        entry = self._table.get(key)
+        first = None
+        if entry is not None:
+            entry_depth, entry_score, entry_flag, first = entry
+            if entry_depth >= depth:
+                if entry_flag == 0:
+                    return entry_score
+                if entry_flag < 0 and entry_score <= alpha:
+                    return entry_score
+                if entry_flag > 0 and entry_score >= beta:
+                    return entry_score
+
+        if blocks:
+            moves = blocks[:1]
+        else:
+            moves = [ idx for idx in ON_GRID_IDX if empty >> idx & 1 ]
+            if depth >= 2:
+                moves = self._order(moves, mine, theirs, my_threats, their_threats, first)
+            elif first is not None:
+                moves.remove(first)
+                moves.insert(0, first)
+
+        original_alpha = alpha
+        best_score, best_idx = -WIN_SCORE - 1, moves[0]
+        for idx in moves:
+            child_mine, child_canoes, _ = place(mine, my_canoes, idx)
+            score = -self._negamax(theirs, child_mine, their_canoes, child_canoes, depth - 1, -beta, -alpha, ply + 1)
+            if score > best_score:
+                best_score, best_idx = score, idx
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                break
+
+        # Flags: 0 exact, -1 upper bound (failed low), 1 lower bound (failed high).
+        flag = -1 if best_score <= original_alpha else (1 if best_score >= beta else 0)
+        self._table[key] = (depth, best_score, flag, best_idx)
+        return best_score
@@ -0,0 +1,284 @@
+import multiprocessing
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from canoebot.board import GameState, Player
+from canoebot.experience import ExperienceBuffer, ExperienceCollector
+
+__all__ = [
+    'EpisodeRing',
+    'WeightStore',
+    'run',
+]
+
+# Actor/learner self-play. Actor processes play ACAgent self-play games on a NumpyModel
+# (no TensorFlow) and append every finished episode to an EpisodeRing; the learner,
+# in the parent process, trains the Keras model on rows taken from the ring with
+# training.train_ac and publishes its weights to a WeightStore every few batches. Both
+# live in multiprocessing.shared_memory blocks, so neither episodes nor weights go
+# through pipes or files. Actors are forked before the learner imports TensorFlow.
+
+
+class WeightStore():
+    """Flat float32 copy of a model's weights in shared memory, with a version number.
+
+    One writer publishes whole weight sets; readers copy them out under a sequence lock:
+    the sequence number is odd while a publish is in progress, and a read that saw it
+    change is retried, so readers never keep a half-written set.
+    """
+    def __init__(self, shapes, name=None):
+        self.shapes = [ tuple(shape) for shape in shapes ]
+        self.sizes = [ int(np.prod(shape)) for shape in self.shapes ]
+        nbytes = 16 + 4 * sum(self.sizes)
+        self.shm = shared_memory.SharedMemory(name=name, create=name is None, size=nbytes)
+        self._header = np.ndarray((2,), dtype=np.int64, buffer=self.shm.buf)  # sequence, version
+        self._flat = np.ndarray((sum(self.sizes),), dtype=np.float32, buffer=self.shm.buf, offset=16)
+        if name is None:
+            self._header[:] = 0
+
+    @property
+    def version(self):
+        return int(self._header[1])
+
+    def publish(self, arrays):
+        self._header[0] += 1
+        offset = 0
+        for array, size in zip(arrays, self.sizes):
+            self._flat[offset:offset + size] = np.ravel(array)
+            offset += size
+        self._header[1] += 1
+        self._header[0] += 1
+        return self.version
+
+    def read_into(self, arrays):
+        # Copies the latest weights into arrays (shaped like self.shapes) and returns
+        # their version.
+        while True:
+            sequence = int(self._header[0])
+            if sequence % 2:
+                time.sleep(0)
+                continue
+            version = int(self._header[1])
+            offset = 0
+            for array, size in zip(arrays, self.sizes):
+                array.reshape(-1)[:] = self._flat[offset:offset + size]
+                offset += size
+            if int(self._header[0]) == sequence:
+                return version
+
+    def close(self, unlink=False):
+        del self._header, self._flat
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+class EpisodeRing():
+    """Fixed-capacity FIFO of experience rows in shared memory.
+
+    put() appends a whole episode, waiting while the ring is too full to hold it;
+    take() removes up to n of the oldest rows. The write and read counters sit in the
+    block's header and both are changed under lock.
+    """
+    def __init__(self, capacity, state_shape, lock, name=None):
+        self.capacity = capacity
+        self.state_shape = tuple(state_shape)
+        self.lock = lock
+        fields = [
+            ('states', np.float32, self.state_shape),
+            ('actions', np.int32, ()),
+            ('rewards', np.float32, ()),
+            ('advantages', np.float32, ()),
+        ]
+        offsets, nbytes = [], 16
+        for _, dtype, shape in fields:
+            offsets.append(nbytes)
+            nbytes += capacity * int(np.prod(shape)) * np.dtype(dtype).itemsize
+            nbytes += -nbytes % 8
+        self.shm = shared_memory.SharedMemory(name=name, create=name is None, size=nbytes)
+        self._counters = np.ndarray((2,), dtype=np.int64, buffer=self.shm.buf)  # written, read
+        self._arrays = {
+            field: np.ndarray((capacity,) + shape, dtype=dtype, buffer=self.shm.buf, offset=offset)
+            for (field, dtype, shape), offset in zip(fields, offsets)
+        }
+        if name is None:
+            self._counters[:] = 0
+
+    def __len__(self):
+        return int(self._counters[0] - self._counters[1])
+
+    def put(self, episode, stop=None):
+        # Returns False instead if stop (an Event) is set while waiting for space.
+        n = len(episode.actions)
+        if n > self.capacity:
+            raise ValueError(f'episode of {n} rows does not fit a ring of {self.capacity}')
+        while True:
+            with self.lock:
+                written, read = (int(c) for c in self._counters)
+                if self.capacity - (written - read) >= n:
+                    rows = (written + np.arange(n)) % self.capacity
+                    for field, array in self._arrays.items():
+                        array[rows] = getattr(episode, field)
+                    self._counters[0] = written + n
+                    return True
+            if stop is not None and stop.is_set():
+                return False
+            time.sleep(0.001)
+
+    def take(self, n):
+        with self.lock:
+            written, read = (int(c) for c in self._counters)
+            n = min(n, written - read)
+            rows = (read + np.arange(n)) % self.capacity
+            batch = ExperienceBuffer(**{ field: array[rows] for field, array in self._arrays.items() })
+            self._counters[1] = read + n
+        return batch
+
+    def close(self, unlink=False):
+        del self._counters, self._arrays
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def model_weights(numpy_model):
+    # A NumpyModel's weight arrays in graph order: the layout of its WeightStore.
+    return [ w for _, _, layer in numpy_model.nodes for w in layer.weights ]
+
+
+def _actor(actor_id, model_name, encoder_name, ring, weights, stop, games, seed):
+    from canoebot import agent, encoders, utils
+    np.random.seed((seed + actor_id) % 2**32)
+    model = utils.load_numpy_model(model_name)
+    arrays = model_weights(model)
+    player = agent.ACAgent(model, encoders.get_encoder_by_name(encoder_name))
+    version = 0
+    while not stop.is_set():
+        if weights.version != version:
+            version = weights.read_into(arrays)
+        collectors = { side: ExperienceCollector(state_dtype=np.float32) for side in Player }
+        for collector in collectors.values():
+            collector.begin_episode()
+        game = GameState.new_game(Player.red if np.random.random() < 0.5 else Player.yellow)
+        while not game.is_over():
+            player.set_collector(collectors[game.current_player])
+            game.push(player.select_move(game))
+        player.set_collector(None)
+        for side, collector in collectors.items():
+            collector.complete_episode(0 if game.winner == 0 else (1 if game.winner == side else -1))
+            if not ring.put(collector.to_buffer(), stop):
+                return
+        games[actor_id] += 1
+
+
+def run(model_name, num_actors=None, duration=60.0, batch_size=256, publish_every=10, ring_capacity=65536,
+        learning_rate=0.01, mirror=False, report_every=10.0, encoder_name='relative', seed=0):
+    """Trains model_name for duration seconds with num_actors self-play actors feeding one
+    learner. model_name needs both its .h5 (trained by the learner) and its .npz export
+    (the actors' network). Returns (keras model, summary dict)."""
+    from canoebot import encoders, training, utils
+    num_actors = num_actors or max(1, multiprocessing.cpu_count() - 1)
+    numpy_model = utils.load_numpy_model(model_name)
+    shapes = [ w.shape for w in model_weights(numpy_model) ]
+    layer_names = [ name for name, _, layer in numpy_model.nodes if layer.weights ]
+    state_shape = encoders.get_encoder_by_name(encoder_name).shape()
+
+    context = multiprocessing.get_context('fork')
+    ring = EpisodeRing(ring_capacity, state_shape, context.Lock())
+    weights = WeightStore(shapes)
+    stop = context.Event()
+    games = context.Array('q', num_actors, lock=False)
+    actors = [
+        context.Process(target=_actor, args=(i, model_name, encoder_name, ring, weights, stop, games, seed),
+                        name=f'canoebot-actor-{i}', daemon=True)
+        for i in range(num_actors)
+    ]
+    for actor in actors:
+        actor.start()
+
+    model = utils.load_model(model_name)
+
+    def publish():
+        return weights.publish([ w for name in layer_names for w in model.get_layer(name).get_weights() ])
+
+    def batches():
+        # Full batches from the ring until duration is up, publishing weights every
+        # publish_every batches and printing throughput every report_every seconds.
+        count = samples = 0
+        last_report = start
+        while time.monotonic() - start < duration:
+            if len(ring) < batch_size:
+                time.sleep(0.001)
+                continue
+            batch = ring.take(batch_size)
+            count += 1
+            samples += len(batch.actions)
+            yield batch
+            if count % publish_every == 0:
+                publish()
+            now = time.monotonic()
+            if report_every and now - last_report >= report_every:
+                elapsed = now - start
+                print(f'selfplay: {sum(games)} games, {sum(games) / elapsed:.1f} games/sec; '
+                      f'{samples} samples, {samples / elapsed:.0f} samples/sec; weights v{weights.version}')
+                last_report = now
+
+    publish()
+    start = time.monotonic()
+    try:
+        source = training.mirror_batches(batches()) if mirror else batches()
+        learner = training.train_ac(model, source, learning_rate=learning_rate, report_every=0)
+        elapsed = time.monotonic() - start
+    finally:
+        stop.set()
+        for actor in actors:
+            actor.join(timeout=10)
+        ring.close(unlink=True)
+        final_version = weights.version
+        weights.close(unlink=True)
+    summary = {
+        'seconds': elapsed,
+        'actors': num_actors,
+        'games': sum(games),
+        'games_per_sec': sum(games) / elapsed,
+        'actor_games': list(games),
+        'learner_samples': learner['samples'],
+        'learner_samples_per_sec': learner['samples'] / elapsed,
+        'learner_batches': learner['batches'],
+        'mean_loss': learner['mean_loss'],
+        'weights_version': final_version,
+    }
+    return model, summary
+
+
+def main():
+    # python -m canoebot.selfplay ac-v12 --actors 7 --duration 600 --out ac-v13
+    import argparse
+    import json
+    from canoebot import utils
+    parser = argparse.ArgumentParser(description="Continuous actor/learner self-play training.")
+    parser.add_argument('model', help="model name in generated_models/, with .h5 and .npz files")
+    parser.add_argument('--out', help="name to save the trained model as (.h5 and .npz)")
+    parser.add_argument('--actors', type=int, default=None, help="defaults to the number of CPUs minus one")
+    parser.add_argument('--duration', type=float, default=60.0, help="seconds of training")
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--publish-every', type=int, default=10, help="batches between weight updates")
+    parser.add_argument('--ring-capacity', type=int, default=65536)
+    parser.add_argument('--lr', type=float, default=0.01)
+    parser.add_argument('--mirror', action='store_true', help="mirror a random half of every batch")
+    parser.add_argument('--report-every', type=float, default=10.0, help="seconds between reports")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    model, summary = run(args.model, args.actors, args.duration, args.batch_size, args.publish_every,
+                         args.ring_capacity, args.lr, args.mirror, args.report_every, seed=args.seed)
+    if args.out:
+        utils.save_model(model, args.out)
+        utils.export_numpy_model(model, utils.MODEL_DIR + args.out + '.npz')
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,334 @@
+import json
+import multiprocessing
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from concurrent.futures import Future
+
+__all__ = [
+    'Client',
+    'Dispatcher',
+    'serve',
+]
+
+# A standalone move server: worker processes each build their own agent (after fork, so
+# the parent never loads a model) and take positions from their own queue, in batches
+# when requests pile up. The parent hands each request to the worker with the fewest
+# outstanding and serves them over a Unix domain socket.
+#
+# Protocol, per connection, one request at a time:
+#   move request   21 bytes: reds (10 bytes), yellows (10 bytes), player to move (1 red, 2 yellow)
+#                  the peg masks are 78-bit little-endian ints, bit 13 * row + col
+#   move response  1 byte: the point index played, or ERROR
+#   stats request  21 bytes with player 0
+#   stats response 4-byte little-endian length, then that many bytes of JSON
+REQUEST_SIZE = 21
+ERROR = 0xff
+STATS = 0
+# Seconds a connection waits for a move before answering ERROR.
+REQUEST_TIMEOUT = 10.0
+# Seconds between checks that the worker processes are still alive.
+LIVENESS_INTERVAL = 1.0
+
+
+def encode_request(reds, yellows, player):
+    return reds.to_bytes(10, 'little') + yellows.to_bytes(10, 'little') + bytes([player])
+
+
+def decode_request(data):
+    return int.from_bytes(data[:10], 'little'), int.from_bytes(data[10:20], 'little'), data[20]
+
+
+def _recv_exactly(sock, n):
+    data = b''
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def _worker(worker_id, agent_spec, cache_size, max_batch_size, tasks, results):
+    # Imported here so the model is only ever loaded in the worker process.
+    from canoebot.arena import make_agent
+    from canoebot.board import Board, GameState, Player
+    from canoebot.cache import PositionCache
+    agent = make_agent(agent_spec)
+    if cache_size and hasattr(agent, 'set_cache'):
+        agent.set_cache(PositionCache(cache_size))
+    results.put((worker_id, 'ready', None))
+
+    def select_one(game):
+        try:
+            return agent.select_move(game).point.to_idx()
+        except Exception:
+            return ERROR
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        batch = [task]
+        while len(batch) < max_batch_size:
+            try:
+                task = tasks.get_nowait()
+            except queue.Empty:
+                break
+            if task is None:
+                tasks.put(None)
+                break
+            batch.append(task)
+        start = time.perf_counter()
+        games = []
+        for _, reds, yellows, player in batch:
+            board = Board()
+            board.red_bits, board.yellow_bits = reds, yellows
+            games.append(GameState(board, Player(player), None, None))
+        try:
+            moves = [ move.point.to_idx() for move in agent.select_moves(games) ]
+        except Exception:
+            # One bad position shouldn't fail the rest of the batch: retry them one at a time.
+            moves = [ select_one(game) for game in games ]
+        busy = time.perf_counter() - start
+        results.put((worker_id, busy, [ (request_id, move) for (request_id, *_), move in zip(batch, moves) ]))
+
+
+class Dispatcher():
+    """Feeds move requests to a pool of worker processes and hands back their answers.
+
+    submit() returns a Future resolving to the point index played. Tracks the number of
+    requests queued or in progress and each worker's requests, batches and busy time.
+    Each request is queued for one worker, so a worker process that dies fails the
+    requests it was given; once none is left, every later request fails. abandon()
+    drops a request whose caller stopped waiting.
+    """
+    def __init__(self, agent_spec='ac:ac-v12', num_workers=None, cache_size=100000, max_batch_size=32):
+        self.num_workers = num_workers or os.cpu_count()
+        # Fork where available so workers start without re-importing the parent's modules;
+        # the model itself is loaded by each worker.
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+        self._tasks = [ context.Queue() for _ in range(self.num_workers) ]
+        self._results = context.Queue()
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self.requests = 0
+        self.started = time.monotonic()
+        self.workers = [ {'requests': 0, 'batches': 0, 'busy_seconds': 0.0, 'ready': False, 'alive': True}
+                         for _ in range(self.num_workers) ]
+        # Request ids handed to each worker and not answered yet.
+        self._in_progress = [ set() for _ in range(self.num_workers) ]
+        self._processes = [
+            context.Process(target=_worker, args=(i, agent_spec, cache_size, max_batch_size, self._tasks[i], self._results),
+                            name=f'canoebot-worker-{i}', daemon=True)
+            for i in range(self.num_workers)
+        ]
+        for process in self._processes:
+            process.start()
+        self._reader = threading.Thread(target=self._read_results, name='canoebot-results', daemon=True)
+        self._reader.start()
+
+    def submit(self, reds, yellows, player):
+        future = Future()
+        with self._lock:
+            alive = [ i for i, w in enumerate(self.workers) if w['alive'] ]
+            if not alive:
+                future.set_exception(RuntimeError('no worker process is alive'))
+                return future
+            worker_id = min(alive, key=lambda i: len(self._in_progress[i]))
+            request_id = self._next_id
+            self._next_id += 1
+            future.request_id = request_id
+            self._futures[request_id] = future
+            self._in_progress[worker_id].add(request_id)
+            self.requests += 1
+        self._tasks[worker_id].put((request_id, reds, yellows, player))
+        return future
+
+    def abandon(self, future):
+        # Forgets a submitted request; its answer, if it comes, is dropped.
+        with self._lock:
+            self._futures.pop(future.request_id, None)
+            for requests in self._in_progress:
+                requests.discard(future.request_id)
+
+    @property
+    def queue_depth(self):
+        with self._lock:
+            return len(self._futures)
+
+    def wait_ready(self, timeout=None):
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while not all(w['ready'] for w in self.workers):
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            if not all(w['alive'] for w in self.workers):
+                return False
+            time.sleep(0.05)
+        return True
+
+    def _read_results(self):
+        last_check = time.monotonic()
+        while True:
+            try:
+                message = self._results.get(timeout=LIVENESS_INTERVAL)
+            except queue.Empty:
+                message = ()
+            if message is None:
+                return
+            if time.monotonic() - last_check >= LIVENESS_INTERVAL:
+                self._check_workers()
+                last_check = time.monotonic()
+            if not message:
+                continue
+            worker_id, busy, answers = message
+            worker = self.workers[worker_id]
+            if busy == 'ready':
+                worker['ready'] = True
+                continue
+            with self._lock:
+                worker['batches'] += 1
+                worker['requests'] += len(answers)
+                worker['busy_seconds'] += busy
+                self._in_progress[worker_id].difference_update(request_id for request_id, _ in answers)
+                futures = [ (self._futures.pop(request_id, None), move) for request_id, move in answers ]
+            for future, move in futures:
+                if future is not None:
+                    future.set_result(move)
+
+    def _check_workers(self):
+        # Fails the requests handed to workers that have died.
+        failed = []
+        with self._lock:
+            for i, (process, worker) in enumerate(zip(self._processes, self.workers)):
+                if worker['alive'] and not process.is_alive():
+                    worker['alive'] = False
+                    failed.extend(self._in_progress[i])
+                    self._in_progress[i].clear()
+            futures = [ self._futures.pop(request_id) for request_id in failed if request_id in self._futures ]
+        for future in futures:
+            future.set_exception(RuntimeError('worker process died'))
+
+    def stats(self):
+        uptime = time.monotonic() - self.started
+        with self._lock:
+            workers = [ dict(w, worker=i, utilization=w['busy_seconds'] / uptime if uptime > 0 else 0.0)
+                        for i, w in enumerate(self.workers) ]
+            return {
+                'uptime': uptime,
+                'requests': self.requests,
+                'queue_depth': len(self._futures),
+                'workers': workers,
+            }
+
+    def close(self):
+        for tasks in self._tasks:
+            tasks.put(None)
+        for process in self._processes:
+            process.join(timeout=5)
+        self._results.put(None)
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        dispatcher = self.server.dispatcher
+        timeout = self.server.request_timeout
+        while True:
+            data = _recv_exactly(self.request, REQUEST_SIZE)
+            if data is None:
+                return
+            reds, yellows, player = decode_request(data)
+            if player == STATS:
+                payload = json.dumps(dispatcher.stats()).encode()
+                self.request.sendall(struct.pack('<I', len(payload)) + payload)
+                continue
+            if player not in (1, 2):
+                self.request.sendall(bytes([ERROR]))
+                continue
+            future = dispatcher.submit(reds, yellows, player)
+            try:
+                move = future.result(timeout)
+            except TimeoutError:
+                dispatcher.abandon(future)
+                move = ERROR
+            except Exception:
+                move = ERROR
+            self.request.sendall(bytes([move]))
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(path, dispatcher, request_timeout=REQUEST_TIMEOUT):
+    """Serves dispatcher on a Unix domain socket at path until interrupted. A move not
+    ready within request_timeout seconds is answered with ERROR."""
+    if os.path.exists(path):
+        os.unlink(path)
+    server = _Server(path, _Handler)
+    server.dispatcher = dispatcher
+    server.request_timeout = request_timeout
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.unlink(path)
+
+
+class Client():
+    """Blocking client for one server connection; use one per thread."""
+    def __init__(self, path):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+
+    def select_move(self, reds, yellows, player):
+        # reds/yellows are peg bitmasks, player 1 (red) or 2 (yellow); returns the point
+        # index to play.
+        self.sock.sendall(encode_request(reds, yellows, player))
+        data = _recv_exactly(self.sock, 1)
+        if data is None:
+            raise ConnectionError('server closed the connection')
+        if data[0] == ERROR:
+            raise ValueError('server could not select a move')
+        return data[0]
+
+    def stats(self):
+        self.sock.sendall(encode_request(0, 0, STATS))
+        (length,) = struct.unpack('<I', _recv_exactly(self.sock, 4))
+        return json.loads(_recv_exactly(self.sock, length))
+
+    def close(self):
+        self.sock.close()
+
+
+def main():
+    # python -m canoebot.server --socket /tmp/canoebot.sock --workers 8 --agent ac:ac-v12
+    import argparse
+    parser = argparse.ArgumentParser(description="Serve canoebot moves over a Unix domain socket.")
+    parser.add_argument('--socket', default='/tmp/canoebot.sock')
+    parser.add_argument('--workers', type=int, default=None, help="defaults to the number of CPUs")
+    parser.add_argument('--agent', default='ac:ac-v12', help="agent spec, as in canoebot.arena")
+    parser.add_argument('--cache-size', type=int, default=100000)
+    parser.add_argument('--max-batch-size', type=int, default=32)
+    parser.add_argument('--timeout', type=float, default=REQUEST_TIMEOUT, help="seconds to wait for a move")
+    args = parser.parse_args()
+
+    dispatcher = Dispatcher(args.agent, args.workers, args.cache_size, args.max_batch_size)
+    dispatcher.wait_ready()
+    print(f"Serving {args.agent} with {dispatcher.num_workers} workers on {args.socket}")
+    try:
+        serve(args.socket, dispatcher, args.timeout)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        dispatcher.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+import math
+import time
+
+__all__ = [
+    'LatencyHistogram',
+    'Timings',
+]
+
+# Per-phase latency histograms for the move-selection hot path. Callers hold an optional
+# Timings (None when disabled) and time a phase with
+#   start = time.perf_counter()
+#   ...
+#   start = timings.lap('encode', start)
+# so a disabled timer costs one `is not None` check per phase.
+
+
+class LatencyHistogram():
+    # Log-spaced buckets: BUCKETS_PER_OCTAVE per doubling from MIN_SECONDS, so a
+    # percentile is accurate to about 9% over 1us..30s with constant memory.
+    MIN_SECONDS = 1e-6
+    BUCKETS_PER_OCTAVE = 8
+    NUM_BUCKETS = 25 * BUCKETS_PER_OCTAVE
+
+    def __init__(self):
+        self.counts = [0] * self.NUM_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        if seconds > self.MIN_SECONDS:
+            bucket = min(int(math.log2(seconds / self.MIN_SECONDS) * self.BUCKETS_PER_OCTAVE), self.NUM_BUCKETS - 1)
+        else:
+            bucket = 0
+        self.counts[bucket] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        # Upper edge of the bucket holding the q-th percentile, in seconds.
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for bucket, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return min(self.MIN_SECONDS * 2 ** ((bucket + 1) / self.BUCKETS_PER_OCTAVE), self.max)
+        return self.max
+
+    def summary(self):
+        # Times in milliseconds.
+        return {
+            'count': self.count,
+            'mean_ms': 1000 * self.total / self.count if self.count else 0.0,
+            'p50_ms': 1000 * self.percentile(50),
+            'p95_ms': 1000 * self.percentile(95),
+            'p99_ms': 1000 * self.percentile(99),
+            'max_ms': 1000 * self.max,
+        }
+
+
+class Timings():
+    """A LatencyHistogram per named phase."""
+    def __init__(self):
+        self.histograms = {}
+        self.since = time.time()
+
+    def record(self, phase, seconds):
+        histogram = self.histograms.get(phase)
+        if histogram is None:
+            histogram = self.histograms[phase] = LatencyHistogram()
+        histogram.record(seconds)
+
+    def lap(self, phase, start):
+        # Records the time since start (a perf_counter value) and returns the current one.
+        now = time.perf_counter()
+        self.record(phase, now - start)
+        return now
+
+    def stats(self):
+        return { phase: histogram.summary() for phase, histogram in self.histograms.items() }
+
+    def reset(self):
+        self.histograms = {}
+        self.since = time.time()
@@ -0,0 +1,251 @@
+import time
+
+import numpy as np
+
+from canoebot.experience import FIELDS, ExperienceBuffer, ExperienceReader
+from canoebot.geometry import MIRROR_PERMUTATION, NUM_COLS
+
+__all__ = [
+    'buffer_batches',
+    'mirror_batches',
+    'mirror_experience',
+    'policy_targets',
+    'stream_batches',
+    'train_ac',
+    'train_policy',
+    'train_q',
+]
+
+# Training from experience files larger than memory. stream_batches reads chunk-sized
+# blocks from one or more experience HDF5 files and mixes them in a shuffle buffer; the
+# train_* functions take any iterable of ExperienceBuffer batches (streamed, or
+# buffer_batches over an in-memory buffer) and run one optimizer step per batch.
+# mirror_batches wraps either source to add left-right mirrored positions as the batches
+# go by. TensorFlow is imported by the train functions only.
+
+
+def policy_targets(actions, weights, num_points):
+    # (N, num_points) rows holding weights[i] at actions[i] and zero elsewhere.
+    targets = np.zeros((len(actions), num_points), dtype=np.float32)
+    targets[np.arange(len(actions)), actions] = weights
+    return targets
+
+
+def _concat(buffers):
+    return ExperienceBuffer(**{ name: np.concatenate([ getattr(b, name) for b in buffers ]) for name in FIELDS })
+
+
+def _take(buffer, rows):
+    return ExperienceBuffer(**{ name: getattr(buffer, name)[rows] for name in FIELDS })
+
+
+def buffer_batches(experience, batch_size, shuffle=True):
+    # Batches of an in-memory ExperienceBuffer, in random order unless shuffle is False.
+    n = len(experience.actions)
+    order = np.random.permutation(n) if shuffle else np.arange(n)
+    for start in range(0, n, batch_size):
+        yield _take(experience, order[start:start + batch_size])
+
+
+def mirror_experience(experience, rows=None):
+    """The left-right mirror image of experience: board columns reversed in the states and
+    actions mapped through MIRROR_PERMUTATION. With a boolean array rows, only those rows
+    are mirrored. The board and its canoes are symmetric, so every encoder plane (pegs,
+    open cells, completion cells) mirrors by reversing the column axis: the last one for
+    RelativeEncoder's (planes, rows, cols), the one before for the channels-last encoders."""
+    states, actions = experience.states, np.asarray(experience.actions)
+    axis = -1 if states.shape[-1] == NUM_COLS else -2
+    assert states.shape[axis] == NUM_COLS, "states must be board tensors"
+    if rows is None:
+        states, actions = np.flip(states, axis), MIRROR_PERMUTATION[actions]
+    else:
+        states = np.where(rows.reshape((-1,) + (1,) * (states.ndim - 1)), np.flip(states, axis), states)
+        actions = np.where(rows, MIRROR_PERMUTATION[actions], actions)
+    return ExperienceBuffer(states=np.ascontiguousarray(states), actions=actions,
+                            rewards=experience.rewards, advantages=experience.advantages)
+
+
+def mirror_batches(batches, double=False):
+    # Mirrors a random half of each batch's rows, so over an epoch every position is
+    # seen in either orientation at the same batch size; with double, each batch is
+    # followed by its full mirror image in the same batch (twice the rows).
+    for batch in batches:
+        if double:
+            yield _concat([batch, mirror_experience(batch)])
+        else:
+            yield mirror_experience(batch, np.random.random(len(batch.actions)) < 0.5)
+
+
+def stream_batches(h5files, batch_size, shuffle_buffer=65536, block_size=4096, epochs=1):
+    """Yields ExperienceBuffer batches from the experience groups of h5files.
+
+    Blocks of block_size rows are read in random order across all files (contiguous
+    reads, matching the chunked layout ExperienceWriter produces) and collected until
+    shuffle_buffer rows are held; the buffer is then shuffled and emitted as batches.
+    Leftover rows short of a batch carry over into the next fill, so only the last
+    batch of each epoch can be smaller than batch_size. h5files are open h5py files.
+    """
+    readers = [ ExperienceReader(f) for f in h5files ]
+    blocks = [ (r, start) for r in readers for start in range(0, len(r), block_size) ]
+    for _ in range(epochs):
+        held, held_rows = [], 0
+        for i in np.random.permutation(len(blocks)):
+            reader, start = blocks[i]
+            block = reader.read(start, min(start + block_size, len(reader)))
+            held.append(block)
+            held_rows += len(block.actions)
+            if held_rows < shuffle_buffer:
+                continue
+            buffer = _concat(held)
+            order = np.random.permutation(held_rows)
+            full = held_rows - held_rows % batch_size
+            for start in range(0, full, batch_size):
+                yield _take(buffer, order[start:start + batch_size])
+            held = [_take(buffer, order[full:])]
+            held_rows -= full
+        if held_rows:
+            yield from buffer_batches(_concat(held), batch_size)
+
+
+class _Throughput():
+    def __init__(self, report_every, label):
+        self.report_every = report_every
+        self.label = label
+        self.samples = 0
+        self.batches = 0
+        self.loss = 0.0
+        self.start = time.perf_counter()
+
+    def update(self, n, loss):
+        self.samples += n
+        self.batches += 1
+        self.loss += float(loss)
+        if self.report_every and self.batches % self.report_every == 0:
+            print(f'{self.label}: {self.samples} samples, {self.samples_per_sec:.0f} samples/sec, '
+                  f'mean loss {self.loss / self.batches:.4f}')
+
+    @property
+    def samples_per_sec(self):
+        elapsed = time.perf_counter() - self.start
+        return self.samples / elapsed if elapsed > 0 else 0.0
+
+    def summary(self):
+        return {
+            'samples': self.samples,
+            'batches': self.batches,
+            'seconds': time.perf_counter() - self.start,
+            'samples_per_sec': self.samples_per_sec,
+            'mean_loss': self.loss / self.batches if self.batches else 0.0,
+        }
+
+
+def _sgd(learning_rate, clipnorm=None):
+    from tensorflow.keras.optimizers import SGD
+    return SGD(learning_rate=learning_rate, clipnorm=clipnorm)
+
+
+def train_policy(model, batches, learning_rate=0.01, clipnorm=1.0, report_every=100):
+    """Policy gradient for a PolicyAgent model: cross-entropy against the reward at the
+    action taken. Returns a summary dict with samples/sec and the mean loss."""
+    model.compile(loss='categorical_crossentropy', optimizer=_sgd(learning_rate, clipnorm))
+    num_points = model.outputs[0].shape[-1]
+    meter = _Throughput(report_every, 'policy')
+    for batch in batches:
+        targets = policy_targets(batch.actions, batch.rewards, num_points)
+        meter.update(len(batch.actions), model.train_on_batch(batch.states, targets))
+    return meter.summary()
+
+
+def train_q(model, batches, learning_rate=0.1, report_every=100):
+    """Regresses a QAgent model's value of the action taken onto the reward. model is the
+    two-input (board, one-hot move) model or a single-input all-moves model."""
+    model.compile(loss='mse', optimizer=_sgd(learning_rate))
+    all_moves = len(model.inputs) == 1
+    meter = _Throughput(report_every, 'q')
+    for batch in batches:
+        if all_moves:
+            y = np.array(model.predict(batch.states, verbose=0))
+            y[np.arange(len(batch.actions)), batch.actions] = batch.rewards
+            loss = model.train_on_batch(batch.states, y)
+        else:
+            one_hot = np.eye(model.inputs[1].shape[-1], dtype=np.float32)[batch.actions]
+            loss = model.train_on_batch([batch.states, one_hot], batch.rewards)
+        meter.update(len(batch.actions), loss)
+    return meter.summary()
+
+
+def train_ac(model, batches, learning_rate=0.01, clipnorm=1.0, value_weight=0.5, report_every=100):
+    """Actor-critic update for an ACAgent model with (policy, value) outputs.
+
+    The policy loss is the negative log-probability of the action taken weighted by its
+    advantage (reward minus the value estimated when it was played); the value head
+    regresses onto the reward with mean squared error, weighted by value_weight.
+    """
+    import tensorflow as tf
+    optimizer = _sgd(learning_rate, clipnorm)
+    optimizer.build(model.trainable_variables)
+
+    @tf.function
+    def step(states, actions, rewards, advantages):
+        with tf.GradientTape() as tape:
+            policy, value = model(states, training=True)
+            taken = tf.gather(policy, actions, axis=1, batch_dims=1)
+            policy_loss = -tf.reduce_mean(advantages * tf.math.log(tf.maximum(taken, 1e-7)))
+            value_loss = tf.reduce_mean(tf.square(rewards - value[:, 0]))
+            loss = policy_loss + value_weight * value_loss
+        gradients = tape.gradient(loss, model.trainable_variables)
+        optimizer.apply_gradients(zip(gradients, model.trainable_variables))
+        return loss
+
+    meter = _Throughput(report_every, 'ac')
+    for batch in batches:
+        loss = step(tf.constant(batch.states, dtype=tf.float32),
+                    tf.constant(batch.actions, dtype=tf.int32),
+                    tf.constant(batch.rewards, dtype=tf.float32),
+                    tf.constant(batch.advantages, dtype=tf.float32))
+        meter.update(len(batch.actions), loss)
+    return meter.summary()
+
+
+TRAINERS = {
+    'policy': train_policy,
+    'q': train_q,
+    'ac': train_ac,
+}
+
+
+def main():
+    # python -m canoebot.training ac ac-v12 run1.h5 run2.h5 --out ac-v13
+    import argparse
+    import json
+    import h5py
+    from canoebot import utils
+    parser = argparse.ArgumentParser(description="Train a canoebot model from experience files.")
+    parser.add_argument('kind', choices=sorted(TRAINERS))
+    parser.add_argument('model', help="model name in generated_models/")
+    parser.add_argument('experience', nargs='+', help="experience HDF5 files")
+    parser.add_argument('--out', required=True, help="name to save the trained model as")
+    parser.add_argument('--batch-size', type=int, default=512)
+    parser.add_argument('--shuffle-buffer', type=int, default=65536)
+    parser.add_argument('--epochs', type=int, default=1)
+    parser.add_argument('--lr', type=float, default=0.01)
+    parser.add_argument('--report-every', type=int, default=100)
+    parser.add_argument('--mirror', action='store_true', help="mirror a random half of every batch")
+    args = parser.parse_args()
+
+    model = utils.load_model(args.model)
+    files = [ h5py.File(path, 'r') for path in args.experience ]
+    try:
+        batches = stream_batches(files, args.batch_size, shuffle_buffer=args.shuffle_buffer, epochs=args.epochs)
+        if args.mirror:
+            batches = mirror_batches(batches)
+        summary = TRAINERS[args.kind](model, batches, learning_rate=args.lr, report_every=args.report_every)
+    finally:
+        for f in files:
+            f.close()
+    utils.save_model(model, args.out)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == '__main__':
+    main()
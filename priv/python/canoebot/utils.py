@@ -1,51 +1,249 @@
 from __future__ import absolute_import
-import tempfile
+import io
 import os
 
-import h5py
-import tensorflow
-import tensorflow.keras
-from tensorflow.keras.models import load_model, save_model
 from pathlib import Path
 
+# h5py and tensorflow are imported inside the functions that use them, so that
+# importing canoebot for the board, encoders or heuristic agents stays fast.
+
+# Next to this file rather than relative to the working directory; CANOEBOT_MODEL_DIR
+# overrides it.
+MODEL_DIR = os.environ.get('CANOEBOT_MODEL_DIR', str(Path(__file__).resolve().parent / 'generated_models')) + os.sep
+
 def save_model(model, f):
-    tensorflow.keras.models.save_model(model, "./priv/python/canoebot/generated_models/" + f + ".h5")
+    import tensorflow.keras
+    tensorflow.keras.models.save_model(model, MODEL_DIR + f + ".h5")
     
 def load_model(f):
-    return tensorflow.keras.models.load_model("./priv/python/canoebot/generated_models/" + f + ".h5")
+    import tensorflow.keras
+    return tensorflow.keras.models.load_model(MODEL_DIR + f + ".h5")
 
-def save_model_to_hdf5_group(model, f):
-    # Use Keras save_model to save the full model (including optimizer state) to a file.
-    # Then we can embed the contents of that HDF5 file inside ours.
-    tempfd, tempfname = tempfile.mkstemp(prefix='tmp-kerasmodel', suffix='.data')
+def load_numpy_model(f):
+    # Counterpart of load_model for weights written by export_numpy_model; no TensorFlow needed.
+    from canoebot.numpy_model import NumpyModel
+    return NumpyModel.load(MODEL_DIR + f + ".npz")
+
+def load_inference_model(f):
+    # Prefer weights exported by export_numpy_model, which serve without TensorFlow.
     try:
-        print(tempfd)
-        os.close(tempfd)
-        save_model(model, tempfname)
-        serialized_model = h5py.File(tempfname, 'r')
-        root_item = serialized_model.get('/')
-        serialized_model.copy(root_item, f, 'kerasmodel')
-        serialized_model.close()
-    finally:
-        os.unlink(tempfname)
+        return load_numpy_model(f)
+    except FileNotFoundError:
+        return load_model(f)
 
+def _inbound_layer_names(layer_config):
+    # Keras 2 functional configs list [[layer_name, node_index, tensor_index, kwargs], ...];
+    # Keras 3 nests keras tensors carrying a keras_history inside 'args'.
+    nodes = layer_config.get('inbound_nodes', [])
+    if not nodes:
+        return []
+    if len(nodes) > 1:
+        raise ValueError(f"Layer {layer_config['name']} is shared, which export_numpy_model doesn't support")
+    node = nodes[0]
+    if isinstance(node, list):
+        return [ inbound[0] for inbound in node ]
+    names = []
+    def collect(item):
+        if isinstance(item, dict):
+            if item.get('class_name') == '__keras_tensor__':
+                names.append(item['config']['keras_history'][0])
+            else:
+                for value in item.values():
+                    collect(value)
+        elif isinstance(item, (list, tuple)):
+            for value in item:
+                collect(value)
+    collect(node.get('args', []))
+    return names
 
-def load_model_from_hdf5_group(f, custom_objects=None):
-    # Extract the model into a temporary file. Then we can use Keras
-    # load_model to read it.
-    tempfd, tempfname = tempfile.mkstemp(prefix='tmp-kerasmodel', suffix='.data')
+
+def _layer_ref_names(refs):
+    # input_layers/output_layers hold [name, node_index, tensor_index] triples, or a single
+    # bare triple for single-input/output models saved by Keras 3.
+    if refs and isinstance(refs[0], str):
+        refs = [refs]
+    return [ ref[0] for ref in refs ]
+
+
+def export_numpy_model(model, path=None):
+    """Writes a Keras model's layer graph and weights to an .npz file for NumpyModel.
+
+    model may also be a model name, which is loaded from generated_models/ and by
+    default exported next to it as <name>.npz.
+    """
+    import json
+    import numpy as np
+    if isinstance(model, str):
+        if path is None:
+            path = MODEL_DIR + model + ".npz"
+        model = load_model(model)
+    config = model.get_config()
+    layer_configs = config['layers']
+    sequential = not any('inbound_nodes' in layer for layer in layer_configs)
+
+    layers = []
+    arrays = {}
+    if sequential:
+        inputs, previous = ['input'], 'input'
+    else:
+        inputs = _layer_ref_names(config['input_layers'])
+    for layer_config in layer_configs:
+        name = layer_config.get('name', layer_config['config']['name'])
+        if sequential:
+            inbound, previous = [previous], name
+        else:
+            inbound = _inbound_layer_names(layer_config)
+        weights = model.get_layer(name).get_weights() if layer_config['class_name'] != 'InputLayer' else []
+        for i, w in enumerate(weights):
+            arrays[f'{name}/{i}'] = w
+        layers.append({
+            'name': name,
+            'class_name': layer_config['class_name'],
+            'config': layer_config['config'],
+            'inbound': inbound,
+            'num_weights': len(weights),
+        })
+    outputs = [previous] if sequential else _layer_ref_names(config['output_layers'])
+    graph = {'name': config.get('name'), 'inputs': inputs, 'outputs': outputs, 'layers': layers}
+    np.savez(path, __graph__=np.array(json.dumps(graph, default=str)), **arrays)
+
+
+def check_numpy_model(model, numpy_model, inputs, atol=1e-4):
+    """Runs both models on inputs and raises if any output differs by more than atol.
+
+    Returns the largest absolute difference seen.
+    """
+    import numpy as np
+    expected = model(inputs)
+    actual = numpy_model(inputs)
+    if not isinstance(expected, (list, tuple)):
+        expected, actual = [expected], [actual]
+    max_diff = max(float(np.max(np.abs(np.asarray(e) - a))) for e, a in zip(expected, actual))
+    if max_diff > atol:
+        raise AssertionError(f'NumpyModel differs from Keras by {max_diff} (atol={atol})')
+    return max_diff
+
+
+def q_model_all_moves(model):
+    """Wraps a two-input Q model, (board, one-hot move) -> value, as a single-input model
+    mapping a board to the values of all its moves, shape (N, num_points).
+
+    The model must feed the one-hot move straight into a Concatenate with the board
+    features, followed by a Dense layer and then only layers acting on the last axis
+    (Dense, Activation, Dropout). That Dense layer is split: its board rows are applied
+    once per board, and its move rows, one per move since the move is one-hot, are
+    broadcast-added to the result, so the board is never repeated. The wrapper shares
+    the original model's weights; save the original.
+    """
+    import tensorflow as tf
+    board_input, move_input = model.inputs
+    num_points = move_input.shape[-1]
+
+    def consumers(tensor):
+        return [ layer for layer in model.layers
+                 if any(t is tensor for t in tf.nest.flatten(layer.input)) ]
+
+    joins = [ layer for layer in consumers(move_input) if isinstance(layer, tf.keras.layers.Concatenate) ]
+    if len(consumers(move_input)) != 1 or not joins:
+        raise ValueError('q_model_all_moves needs the move input to go straight into a Concatenate')
+    join = joins[0]
+    parts = tf.nest.flatten(join.input)
+    if len(parts) != 2 or join.axis not in (-1, 1):
+        raise ValueError('q_model_all_moves needs the Concatenate to join the board features and the move')
+    move_first = parts[0] is move_input
+    features = parts[1] if move_first else parts[0]
+    tail, tensor = [], join.output
+    while tensor is not model.outputs[0]:
+        following = consumers(tensor)
+        if len(following) != 1:
+            raise ValueError('q_model_all_moves needs a single chain of layers after the Concatenate')
+        tail.append(following[0])
+        tensor = following[0].output
+    if not tail or not isinstance(tail[0], tf.keras.layers.Dense):
+        raise ValueError('q_model_all_moves needs a Dense layer after the Concatenate')
+    split, rest = tail[0], tail[1:]
+    board_features = tf.keras.Model(board_input, features)
+    num_features = features.shape[-1]
+
+    class AllMoves(tf.keras.layers.Layer):
+        def __init__(self, dense, layers, **kwargs):
+            super().__init__(**kwargs)
+            self.dense = dense
+            self.rest = layers
+
+        def call(self, board_vectors):
+            kernel = self.dense.kernel
+            board_rows, move_rows = (kernel[num_points:], kernel[:num_points]) if move_first else \
+                (kernel[:num_features], kernel[num_features:])
+            hidden = tf.matmul(board_vectors, board_rows)
+            if self.dense.use_bias:
+                hidden = hidden + self.dense.bias
+            # (N, 1, units) + (num_points, units): one row per move, the board computed once.
+            x = self.dense.activation(hidden[:, tf.newaxis, :] + move_rows)
+            for layer in self.rest:
+                x = layer(x)
+            return tf.reshape(x, [tf.shape(board_vectors)[0], num_points])
+
+    boards = tf.keras.Input(shape=tuple(board_input.shape[1:]))
+    values = AllMoves(split, rest)(board_features(boards))
+    return tf.keras.Model(boards, values, name=f'{model.name}_all_moves')
+
+
+# Keras 3 only saves to and loads from an open h5py.File through this private module,
+# which may move in any release. Tested with Keras 3.15.
+_KERAS3_HDF5_MODULE = 'keras.src.legacy.saving.legacy_h5_format'
+
+
+def _keras_hdf5():
+    # (save, load) functions taking an open h5py.File. Keras 2's public save_model and
+    # load_model accept one; Keras 3's take paths only, so it goes through _KERAS3_HDF5_MODULE.
+    import importlib
+    import tensorflow.keras
+    version = getattr(tensorflow.keras, '__version__', '2')
+    if int(version.split('.')[0]) < 3:
+        return tensorflow.keras.models.save_model, tensorflow.keras.models.load_model
     try:
-        os.close(tempfd)
-        serialized_model = h5py.File(tempfname, 'w')
+        legacy_h5_format = importlib.import_module(_KERAS3_HDF5_MODULE)
+    except ImportError as e:
+        raise ImportError(f'In-memory HDF5 models need {_KERAS3_HDF5_MODULE}, which Keras {version} '
+                          f'does not have; canoebot is tested with Keras 3.15 (and Keras 2).') from e
+    return legacy_h5_format.save_model_to_hdf5, legacy_h5_format.load_model_from_hdf5
+
+
+def _memory_hdf5(data=None):
+    # An h5py.File backed by a BytesIO: empty and writable, or reading the bytes of an .h5 file.
+    import h5py
+    if data is None:
+        return h5py.File(io.BytesIO(), 'w')
+    return h5py.File(io.BytesIO(data), 'r')
+
+
+def load_model_from_bytes(data, custom_objects=None):
+    # Loads a Keras model from the contents of an .h5 file without touching disk.
+    load = _keras_hdf5()[1]
+    with _memory_hdf5(data) as f:
+        return load(f, custom_objects=custom_objects)
+
+
+def save_model_to_hdf5_group(model, f):
+    # Saves the full model (including optimizer state) into an in-memory HDF5 file, then
+    # embeds that file's contents inside ours as f['kerasmodel'].
+    save = _keras_hdf5()[0]
+    with _memory_hdf5() as serialized_model:
+        save(model, serialized_model)
+        serialized_model.copy(serialized_model['/'], f, 'kerasmodel')
+
+
+def load_model_from_hdf5_group(f, custom_objects=None):
+    # Copies f['kerasmodel'] into an in-memory HDF5 file for Keras to load from.
+    load = _keras_hdf5()[1]
+    with _memory_hdf5() as serialized_model:
         root_item = f.get('kerasmodel')
         for attr_name, attr_value in root_item.attrs.items():
             serialized_model.attrs[attr_name] = attr_value
         for k in root_item.keys():
             f.copy(root_item.get(k), serialized_model, k)
-        serialized_model.close()
-        return load_model(tempfname, custom_objects=custom_objects)
-    finally:
-        os.unlink(tempfname)
+        return load(serialized_model, custom_objects=custom_objects)
 
 
 def set_gpu_memory_target(frac):
@@ -63,11 +261,11 @@ def set_gpu_memory_target(frac):
     This function does nothing if Keras is using a backend other than
     Tensorflow.
     """
-    if tensorflow.backend.backend() != 'tensorflow':
-        return
     # Do the import here, not at the top, in case Tensorflow is not
     # installed at all.
     import tensorflow as tf
+    if tf.backend.backend() != 'tensorflow':
+        return
     from tensorflow.keras.backend import set_session
     config = tf.ConfigProto()
     config.gpu_options.per_process_gpu_memory_fraction = frac
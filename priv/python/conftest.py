@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Tests import canoebot and canoe_ai from this directory, like the Python bridge does.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -0,0 +1,21 @@
+import numpy as np
+import pytest
+
+from canoebot.board import Board
+
+
+def test_peg_arrays_are_read_only():
+    board = Board()
+    board.red_bits = 1 << 5
+    reds = board.reds
+    assert reds[5] and reds.sum() == 1
+    with pytest.raises(ValueError):
+        reds[6] = True
+    with pytest.raises(ValueError):
+        board.yellows[0] = True
+
+    # Assigning a whole array still replaces the bitboard.
+    yellows = np.zeros_like(reds)
+    yellows[7] = True
+    board.yellows = yellows
+    assert board.yellow_bits == 1 << 7
@@ -0,0 +1,93 @@
+import time
+
+import pytest
+
+import canoe_ai
+from canoebot.geometry import ON_GRID_IDX
+
+
+class BrokenAgent():
+    def select_move(self, game_state):
+        raise RuntimeError('network down')
+
+    def select_moves(self, game_states):
+        raise RuntimeError('network down')
+
+
+class BrokenBook():
+    def select_move(self, game_state):
+        raise RuntimeError('bad book')
+
+
+@pytest.fixture
+def broken(monkeypatch):
+    # Every tier past the tactical one raises; init() sees a loaded agent and keeps it.
+    monkeypatch.setattr(canoe_ai, 'agent1', BrokenAgent())
+    monkeypatch.setattr(canoe_ai, 'opening_book', BrokenBook())
+    monkeypatch.setattr(canoe_ai.endgame_solver, 'select_move', BrokenBook().select_move)
+
+
+def pegs(cells):
+    return [ (idx % 13, idx // 13) for idx in cells ]
+
+
+def test_failing_tiers_fall_back(broken):
+    # Two pegs apart on an open board: no tactical move, so only the fallback is left.
+    reds, yellows = pegs(ON_GRID_IDX[:1]), pegs(ON_GRID_IDX[-1:])
+    x, y, tier = canoe_ai.canoe_ai_tiered(reds, yellows, 1)
+    assert tier == 'fallback'
+    assert 13 * y + x in ON_GRID_IDX
+
+    moves = canoe_ai.canoe_ai_batch([(reds, yellows, 1), (reds, yellows, 2)], 1000)
+    assert [ tier for _, _, tier in moves ] == ['fallback', 'fallback']
+
+
+def test_full_board_has_no_move(broken):
+    reds, yellows = pegs(ON_GRID_IDX[::2]), pegs(ON_GRID_IDX[1::2])
+    assert canoe_ai.canoe_ai_tiered(reds, yellows, 1) == (None, None, None)
+    assert canoe_ai.canoe_ai_batch([(reds, yellows, 1)], 1000) == [(None, None, None)]
+
+
+class SlowAgent():
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.calls = 0
+
+    def select_moves(self, game_states):
+        self.calls += 1
+        time.sleep(self.seconds)
+        return [ game_state.legal_moves()[0] for game_state in game_states ]
+
+
+def test_overrunning_network_call_is_not_waited_for(monkeypatch):
+    slow = SlowAgent(1.0)
+    monkeypatch.setattr(canoe_ai, 'agent1', slow)
+    monkeypatch.setattr(canoe_ai, 'opening_book', None)
+    request = (pegs(ON_GRID_IDX[:1]), pegs(ON_GRID_IDX[-1:]), 1)
+    assert canoe_ai.canoe_ai_batch([request], 100)[0][2] == 'fallback'
+
+    # The first call still holds the network thread: the next batch falls back at once
+    # rather than after its own 5 s deadline.
+    start = time.monotonic()
+    assert canoe_ai.canoe_ai_batch([request], 5000)[0][2] == 'fallback'
+    assert time.monotonic() - start < 0.5
+    assert slow.calls == 1
+    canoe_ai._overrun.result()
+
+
+def test_batches_run_the_search_tier(monkeypatch):
+    monkeypatch.setattr(canoe_ai, 'agent1', SlowAgent(0.0))
+    monkeypatch.setattr(canoe_ai, 'opening_book', None)
+    monkeypatch.setattr(canoe_ai, 'SEARCH_SECONDS', 0.01)
+    budgets = []
+
+    def search_move(ac_agent, game, budget):
+        budgets.append(budget)
+        return game.legal_moves()[-1]
+
+    monkeypatch.setattr(canoe_ai, '_search_move', search_move)
+    request = (pegs(ON_GRID_IDX[:1]), pegs(ON_GRID_IDX[-1:]), 1)
+    moves = canoe_ai.canoe_ai_batch([request, request], 1000)
+    assert [ tier for _, _, tier in moves ] == ['search', 'search']
+    assert len(budgets) == 2 and all(0 < b <= 0.01 for b in budgets)
+    assert canoe_ai.canoe_ai_tiered(*request, 1000)[2] == 'search'
@@ -0,0 +1,42 @@
+import numpy as np
+
+from canoebot.experience import FIELDS, ExperienceCollector, combine_experience
+
+
+def collect(collector, states, reward):
+    collector.begin_episode()
+    for i, state in enumerate(states):
+        collector.record_decision(state=state, action=i)
+    collector.complete_episode(reward)
+
+
+def test_combine_no_experience():
+    for collectors in ([], [ExperienceCollector(), ExperienceCollector()]):
+        combined = combine_experience(collectors)
+        for name in FIELDS:
+            assert len(getattr(combined, name)) == 0
+
+
+def test_combine_skips_empty_collectors():
+    full, empty = ExperienceCollector(), ExperienceCollector()
+    collect(full, np.ones((3, 2, 2), dtype=np.float32), 1)
+    combined = combine_experience([empty, full, empty])
+    assert combined.states.shape == (3, 2, 2)
+    assert combined.states.dtype == np.float32
+    assert list(combined.actions) == [0, 1, 2]
+
+
+class NullWriter():
+    def append(self, states, actions, rewards, advantages):
+        pass
+
+
+def test_buffer_outlives_a_flush():
+    # After a flush the collector records the next episodes over the same storage.
+    collector = ExperienceCollector(writer=NullWriter())
+    collect(collector, np.ones((2, 3), dtype=np.float32), 1)
+    buffer = collector.to_buffer()
+    collector.flush()
+    collect(collector, np.zeros((2, 3), dtype=np.float32), -1)
+    assert np.all(buffer.states == 1)
+    assert np.all(buffer.rewards == 1)
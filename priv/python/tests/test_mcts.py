@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from canoebot import agent, encoders, mcts
+from canoebot.board import PLAY_MOVES, GameState, Player, completed_canoes
+from canoebot.geometry import ON_GRID_IDX, solns
+from canoebot.mcts import Node
+
+
+class PeakedModel():
+    # The same sharply peaked policy (low cell indices first) and a zero value for every
+    # position, shaped like an ACAgent model; the search then runs deep along one line.
+    POLICY = np.exp(-np.arange(78) / 2.0).astype(np.float32)
+
+    def __call__(self, X):
+        n = len(X)
+        return np.tile(self.POLICY / self.POLICY.sum(), (n, 1)), np.zeros((n, 1), dtype=np.float32)
+
+    def predict(self, X, **kwargs):
+        return self(X)[0]
+
+
+def make_agent(num_simulations=64):
+    ac = agent.ACAgent(PeakedModel(), encoders.RelativeEncoder(dtype=np.float32))
+    return agent.MCTSAgent(ac, num_simulations=num_simulations, batch_size=8)
+
+
+def test_tree_is_reused_after_opponent_reply():
+    np.random.seed(0)
+    player = make_agent(num_simulations=200)
+    game = GameState.new_game()
+    game.push(player.select_move(game))
+
+    # The opponent plays the reply the search explored most, so its subtree has visits.
+    root = player.tree.root
+    reply = root.children[int(np.argmax(root.visits))]
+    assert reply is not None and reply.is_expanded
+    game.push(PLAY_MOVES[int(root.moves[int(np.argmax(root.visits))])])
+
+    reused = player.tree.set_root(game)
+    assert reused is reply
+    assert reused.visits.sum() > 0
+    player.select_move(game)
+    assert player.tree.root is not None
+
+
+def test_terminal_root_raises():
+    player = make_agent()
+    game = GameState.new_game()
+    player.tree.root = Node(game.board.red_bits, game.board.yellow_bits, 0, 0, Player.red, terminal_value=-1.0)
+    with pytest.raises(ValueError):
+        player.select_move(game)
+
+
+def test_win_on_last_open_cell_is_a_draw():
+    # Red has one canoe and fills the only open cell with the other: the game calls it a draw.
+    first, second = solns[0], next(s for s in solns if not set(s) & set(solns[0]))
+    last = second[-1]
+    reds = sum(1 << idx for idx in first + second if idx != last)
+    others = [ idx for idx in ON_GRID_IDX if not reds >> idx & 1 and idx != last ]
+    yellows = sum(1 << idx for idx in others)
+    parent = Node(reds, yellows, completed_canoes(reds), completed_canoes(yellows), Player.red)
+    parent.moves = np.array([last])
+    parent.children = [None]
+    assert parent.child(0).terminal_value == 0.0
+
+
+def test_root_noise_does_not_accumulate(monkeypatch):
+    # Runs on the same position reuse its root; each run mixes noise into the clean priors.
+    tree = mcts.MCTS(make_agent().ac_agent, num_simulations=8, batch_size=8, dirichlet_alpha=0.3)
+    game = GameState.new_game()
+    for noise_value in (1.0, 0.0, 0.5):
+        monkeypatch.setattr(np.random, 'dirichlet', lambda alpha, v=noise_value: np.full(len(alpha), v))
+        root = tree.run(game)
+        expected = 0.75 * root.clean_priors + 0.25 * noise_value
+        np.testing.assert_allclose(root.priors, expected)
+    assert tree.root is root
+    np.testing.assert_allclose(root.clean_priors.sum(), 1.0)
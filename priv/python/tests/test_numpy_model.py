@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from canoebot import utils
+from canoebot.board import GameState
+from canoebot.encoders import RelativeEncoder
+from canoebot.numpy_model import NumpyModel
+
+
+def small_ac_model(encoder):
+    # A conv trunk with policy and value heads, laid out like the served ACAgent models.
+    from tensorflow import keras
+    board = keras.Input(shape=encoder.shape())
+    x = keras.layers.ZeroPadding2D(1, data_format='channels_first')(board)
+    x = keras.layers.Conv2D(4, 3, activation='relu', data_format='channels_first')(x)
+    x = keras.layers.BatchNormalization(axis=1)(x)
+    x = keras.layers.Flatten()(x)
+    x = keras.layers.Dense(16, activation='relu')(x)
+    policy = keras.layers.Dense(encoder.num_points(), activation='softmax')(x)
+    value = keras.layers.Dense(1, activation='tanh')(x)
+    return keras.Model(board, [policy, value])
+
+
+def random_positions(n):
+    np.random.seed(0)
+    games = []
+    while len(games) < n:
+        game = GameState.new_game()
+        while not game.is_over() and len(games) < n:
+            games.append(game)
+            moves = game.legal_moves()
+            game = game.apply_move(moves[np.random.choice(len(moves))])
+    return games
+
+
+def test_exported_model_matches_keras(tmp_path):
+    encoder = RelativeEncoder(dtype=np.float32)
+    model = small_ac_model(encoder)
+    # Move batch norm off its identity initialization so its weights are exercised too.
+    rng = np.random.default_rng(0)
+    for layer in model.layers:
+        if layer.__class__.__name__ == 'BatchNormalization':
+            layer.set_weights([ rng.uniform(0.5, 1.5, w.shape).astype(np.float32) for w in layer.get_weights() ])
+    path = str(tmp_path / 'small.npz')
+    utils.export_numpy_model(model, path)
+
+    inputs = encoder.encode_batch(random_positions(32))
+    assert utils.check_numpy_model(model, NumpyModel.load(path), inputs, atol=1e-4) <= 1e-4
+
+
+@pytest.mark.parametrize('kernel_size, strides', [(3, 2), (2, 2), (4, 3), (3, (1, 2))])
+def test_strided_same_convolution_matches_keras(tmp_path, kernel_size, strides):
+    from tensorflow import keras
+    board = keras.Input(shape=(9, 13, 3))
+    x = keras.layers.Conv2D(2, kernel_size, strides=strides, padding='same')(board)
+    model = keras.Model(board, keras.layers.Flatten()(x))
+    path = str(tmp_path / 'strided.npz')
+    utils.export_numpy_model(model, path)
+
+    inputs = np.random.default_rng(0).random((4, 9, 13, 3), dtype=np.float32)
+    utils.check_numpy_model(model, NumpyModel.load(path), inputs, atol=1e-4)
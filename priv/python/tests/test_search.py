@@ -0,0 +1,36 @@
+import time
+
+from canoebot.board import completed_canoes
+from canoebot.geometry import ON_GRID_IDX, solns
+from canoebot.search import WIN_SCORE, Search
+
+
+def one_cell_from_win():
+    # (mine, theirs, last): mine holds one canoe and all but `last` of a disjoint second
+    # one; theirs fills every other cell, so `last` is the only open space.
+    first = solns[0]
+    second = next(s for s in solns if not set(s) & set(first))
+    last = second[-1]
+    mine = sum(1 << idx for idx in first + second if idx != last)
+    theirs = sum(1 << idx for idx in ON_GRID_IDX if not mine >> idx & 1 and idx != last)
+    return mine, theirs, last
+
+
+def test_completing_a_pair_with_the_last_open_cell_is_a_draw():
+    mine, theirs, last = one_cell_from_win()
+    search = Search(max_depth=2)
+    assert search.best_move(mine, theirs, completed_canoes(mine), completed_canoes(theirs)) == (last, 0)
+
+    search._deadline = time.monotonic() + 10
+    score = search._negamax(mine, theirs, completed_canoes(mine), completed_canoes(theirs), 2, -WIN_SCORE - 1, WIN_SCORE + 1, 1)
+    assert score == 0
+
+
+def test_search_agent_completes_its_depth():
+    from canoebot.agent import SearchAgent
+    from canoebot.board import GameState
+    player = SearchAgent()
+    game = GameState.new_game()
+    for _ in range(6):
+        game.push(player.select_move(game))
+    assert player.search.depth_reached == player.search.max_depth
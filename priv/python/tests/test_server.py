@@ -0,0 +1,50 @@
+import pytest
+
+from canoebot import server
+from canoebot.geometry import ON_GRID_IDX
+
+FULL_REDS = sum(1 << idx for idx in ON_GRID_IDX[::2])
+FULL_YELLOWS = sum(1 << idx for idx in ON_GRID_IDX[1::2])
+
+
+@pytest.fixture
+def dispatcher():
+    dispatcher = server.Dispatcher('greedy', num_workers=1, cache_size=0)
+    yield dispatcher
+    dispatcher.close()
+
+
+def test_bad_position_does_not_fail_its_batch(dispatcher):
+    # Queued before the worker is up, so it takes both requests as one batch.
+    full = dispatcher.submit(FULL_REDS, FULL_YELLOWS, 1)
+    empty = dispatcher.submit(0, 0, 1)
+    assert full.result(timeout=30) == server.ERROR
+    assert empty.result(timeout=30) in ON_GRID_IDX
+
+
+def test_dead_worker_fails_pending_requests(dispatcher):
+    assert dispatcher.wait_ready(timeout=30)
+    dispatcher._processes[0].kill()
+    dispatcher._processes[0].join()
+    future = dispatcher.submit(0, 0, 1)
+    with pytest.raises(RuntimeError):
+        future.result(timeout=10)
+    assert dispatcher.submit(0, 0, 1).exception(timeout=0) is not None
+
+
+def test_requests_given_to_a_worker_fail_when_it_dies(dispatcher):
+    # Killed before it has even taken the request off its queue.
+    future = dispatcher.submit(0, 0, 1)
+    dispatcher._processes[0].kill()
+    with pytest.raises(RuntimeError):
+        future.result(timeout=10)
+    assert dispatcher.queue_depth == 0
+
+
+def test_abandoned_request_leaves_the_queue(dispatcher):
+    future = dispatcher.submit(0, 0, 1)
+    dispatcher.abandon(future)
+    assert dispatcher.queue_depth == 0
+    assert dispatcher.wait_ready(timeout=30)
+    # The worker's answer to it is dropped; later requests are still answered.
+    assert dispatcher.submit(0, 0, 1).result(timeout=30) in ON_GRID_IDX
@@ -0,0 +1,44 @@
+import threading
+
+import canoe_ai
+from canoebot import registry
+
+
+class FakeAgent():
+    pass
+
+
+def test_swap_evicts_the_previous_model(monkeypatch, tmp_path):
+    models = registry.ModelRegistry(str(tmp_path))
+    monkeypatch.setattr(canoe_ai, 'models', models)
+    monkeypatch.setattr(canoe_ai, 'agent1', FakeAgent())
+    monkeypatch.setattr(canoe_ai, 'opening_book', None)
+    monkeypatch.setattr(canoe_ai, 'model_id', 'ac-v1')
+
+    def load_agent(name, version):
+        models._models[(models.resolve(name, version), 'inference')] = object()
+        return FakeAgent()
+
+    monkeypatch.setattr(canoe_ai, '_load_agent', load_agent)
+    models._models[('ac-v1', 'inference')] = object()
+    assert canoe_ai.swap_model('ac', 2) == 'ac-v2'
+    assert models.loaded() == [('ac-v2', 'inference')]
+
+    # Swapping to the model already served keeps it.
+    assert canoe_ai.swap_model('ac', 2) == 'ac-v2'
+    assert models.loaded() == [('ac-v2', 'inference')]
+
+
+def test_failed_async_swap_is_reported(monkeypatch, tmp_path):
+    monkeypatch.setattr(canoe_ai, 'models', registry.ModelRegistry(str(tmp_path)))
+    monkeypatch.setattr(canoe_ai, 'model_id', 'ac-v1')
+    monkeypatch.setattr(canoe_ai, 'last_swap', None)
+    status = canoe_ai.swap_model_async(b'missing', 3)
+    assert status['status'] in ('loading', 'failed')
+    for thread in threading.enumerate():
+        if thread.name == 'canoebot-swap':
+            thread.join(timeout=10)
+    info = canoe_ai.model_info()
+    assert info['model'] == 'ac-v1'
+    assert info['swap']['status'] == 'failed'
+    assert info['swap']['name'] == 'missing' and 'FileNotFoundError' in info['swap']['error']
@@ -0,0 +1,48 @@
+import numpy as np
+
+from canoebot import encoders, utils
+from canoebot.agent import QAgent
+from canoebot.experience import ExperienceBuffer
+
+
+def small_q_model(encoder):
+    # (board, one-hot move) -> value, as the QAgent models are built.
+    from tensorflow import keras
+    board = keras.Input(shape=encoder.shape())
+    move = keras.Input(shape=(encoder.num_points(),))
+    hidden = keras.layers.Concatenate()([keras.layers.Flatten()(board), move])
+    value = keras.layers.Dense(1, activation='tanh')(keras.layers.Dense(8, activation='relu')(hidden))
+    return keras.Model([board, move], value)
+
+
+def random_experience(encoder, n):
+    rng = np.random.default_rng(0)
+    return ExperienceBuffer(
+        states=rng.random((n,) + encoder.shape(), dtype=np.float32),
+        actions=rng.integers(0, encoder.num_points(), n),
+        rewards=rng.choice([-1.0, 1.0], n).astype(np.float32),
+        advantages=np.zeros(n, dtype=np.float32))
+
+
+def test_train_all_moves_q_model():
+    encoder = encoders.RelativeEncoder(dtype=np.float32)
+    q = small_q_model(encoder)
+    before = [ w.copy() for w in q.get_weights() ]
+    player = QAgent(utils.q_model_all_moves(q), encoder)
+    assert player.scores_all_moves
+
+    summary = player.train(random_experience(encoder, 16), batch_size=16, mirror=True)
+    assert summary['batches'] == 1
+    assert any(not np.array_equal(b, a) for b, a in zip(before, q.get_weights()))
+
+
+def test_all_moves_model_matches_the_q_model():
+    encoder = encoders.RelativeEncoder(dtype=np.float32)
+    q = small_q_model(encoder)
+    all_moves = utils.q_model_all_moves(q)
+    boards = random_experience(encoder, 3).states
+    num_points = encoder.num_points()
+    expected = np.asarray(q.predict([np.repeat(boards, num_points, axis=0), np.tile(np.eye(num_points), (3, 1))], verbose=0))
+    actual = np.asarray(all_moves.predict(boards, verbose=0))
+    assert actual.shape == (3, num_points)
+    np.testing.assert_allclose(actual, expected.reshape(3, num_points), atol=1e-5)
@@ -0,0 +1,26 @@
+import io
+
+import h5py
+import numpy as np
+import pytest
+
+from canoebot import utils
+
+
+def test_model_bytes_round_trip():
+    from tensorflow import keras
+    board = keras.Input(shape=(4,))
+    model = keras.Model(board, keras.layers.Dense(2)(board))
+    buffer = io.BytesIO()
+    with h5py.File(buffer, 'w') as f:
+        utils.save_model_to_hdf5_group(model, f)
+    with h5py.File(io.BytesIO(buffer.getvalue()), 'r') as f:
+        loaded = utils.load_model_from_hdf5_group(f)
+    x = np.ones((1, 4), dtype=np.float32)
+    np.testing.assert_allclose(loaded.predict(x, verbose=0), model.predict(x, verbose=0))
+
+
+def test_missing_legacy_hdf5_module_names_the_keras_version(monkeypatch):
+    monkeypatch.setattr(utils, '_KERAS3_HDF5_MODULE', 'keras.src.no_such_module')
+    with pytest.raises(ImportError, match='Keras 3.15'):
+        utils.load_model_from_bytes(b'')